@@ -0,0 +1,292 @@
+import os
+import select
+import struct
+import sys
+
+# Event kinds queued by a backend. Each queued event is a tuple of the kind followed by its values
+KEY_DOWN = 0
+KEY_UP = 1
+BUTTON_DOWN = 2
+BUTTON_UP = 3
+MOVE = 4
+SCROLL = 5
+
+class Backend:
+    """Base class for the ways simulated input is sent to the operating system.\n\nKeybinds queue their actions on a backend, and the
+    owner of the backend calls `flush` once per poll cycle to send everything that was queued in one batch.
+    Keys and mouse buttons are reference counted across every keybind that uses the backend: a key goes down when the first keybind
+    presses it and up when the last one releases it, so overlapping keybinds never release each other's keys and releasing a key
+    that isn't down sends nothing. Mouse movements and scrolls queued in the same batch are sent as one."""
+    name = "base"
+    def __init__(self):
+        self.events = []            # Events queued since the last flush
+        self.held = {}              # Maps the names of the keys that are down to the amount of keybinds holding them
+        self.held_buttons = {}      # The same for mouse buttons, which have names like keys such as "left"
+        self.move_index = None      # Where the mouse movement of this batch is queued, later movements are added to it
+        self.scroll_index = None
+
+    def press_key(self, key):
+        count = self.held.get(key, 0)
+        self.held[key] = count + 1
+        if not count:
+            self.events.append((KEY_DOWN, key))
+
+    def release_key(self, key):
+        count = self.held.get(key)
+        if count == 1:
+            del self.held[key]
+            self.events.append((KEY_UP, key))
+        elif count:
+            self.held[key] = count - 1
+
+    def press_button(self, button):
+        count = self.held_buttons.get(button, 0)
+        self.held_buttons[button] = count + 1
+        if not count:
+            self.events.append((BUTTON_DOWN, button))
+
+    def release_button(self, button):
+        count = self.held_buttons.get(button)
+        if count == 1:
+            del self.held_buttons[button]
+            self.events.append((BUTTON_UP, button))
+        elif count:
+            self.held_buttons[button] = count - 1
+
+    def move(self, dx: int, dy: int):
+        if self.move_index is None:
+            self.move_index = len(self.events)
+            self.events.append((MOVE, dx, dy))
+        else:
+            _, x, y = self.events[self.move_index]
+            self.events[self.move_index] = (MOVE, x + dx, y + dy)
+
+    def scroll(self, dx: int, dy: int):
+        if self.scroll_index is None:
+            self.scroll_index = len(self.events)
+            self.events.append((SCROLL, dx, dy))
+        else:
+            _, x, y = self.events[self.scroll_index]
+            self.events[self.scroll_index] = (SCROLL, x + dx, y + dy)
+
+    def release_all(self):
+        """Queue a release of every key and mouse button that is still down, no matter how many keybinds hold it."""
+        for key in self.held:
+            self.events.append((KEY_UP, key))
+        for button in self.held_buttons:
+            self.events.append((BUTTON_UP, button))
+        self.held = {}
+        self.held_buttons = {}
+
+    def flush(self):
+        """Send every queued event to the operating system."""
+        if not self.events:
+            return
+        events = self.events
+        self.events = []
+        self.move_index = self.scroll_index = None
+        self.send(events)
+
+    def send(self, events):
+        raise NotImplementedError
+
+    def close(self):
+        """Release whatever the backend holds on to."""
+        pass
+
+class NullBackend(Backend):
+    """Sends nothing. Counts the events it is given and optionally records them, for tests and benchmarks."""
+    name = "null"
+    def __init__(self, record: bool=False):
+        super().__init__()
+        self.record = record
+        self.sent = []          # Every sent batch when recording
+        self.event_count = 0
+        self.flush_count = 0
+
+    def send(self, events):
+        self.event_count += len(events)
+        self.flush_count += 1
+        if self.record:
+            self.sent.append(events)
+
+class PynputBackend(Backend):
+    """Sends input through pynput, one call per event.\n\npynput is imported and its controllers are created on the first flush,
+    unless they are given. Key names are turned into pynput's keys when they are sent: names like "esc" into members of pynput's
+    `Key`, and other names, like "a", are typed as they are."""
+    name = "pynput"
+    def __init__(self, keyboard=None, mouse=None):
+        super().__init__()
+        self.keyboard = keyboard
+        self.mouse = mouse
+        self.keys = None        # pynput's Key and Button enums, imported on the first flush
+        self.buttons = None
+
+    def send(self, events):
+        if self.keys is None:
+            from pynput.keyboard import Key
+            from pynput.mouse import Button
+            self.keys, self.buttons = Key.__members__, Button.__members__
+        if self.keyboard is None:
+            from pynput.keyboard import Controller as KeyboardController
+            self.keyboard = KeyboardController()
+        if self.mouse is None:
+            from pynput.mouse import Controller as MouseController
+            self.mouse = MouseController()
+        for event in events:
+            try:
+                match event[0]:
+                    case 0:     # KEY_DOWN
+                        self.keyboard.press(self.keys.get(event[1], event[1]))
+                    case 1:     # KEY_UP
+                        self.keyboard.release(self.keys.get(event[1], event[1]))
+                    case 2:     # BUTTON_DOWN
+                        self.mouse.press(self.buttons[event[1]])
+                    case 3:     # BUTTON_UP
+                        self.mouse.release(self.buttons[event[1]])
+                    case 4:     # MOVE
+                        self.mouse.move(event[1], event[2])
+                    case 5:     # SCROLL
+                        self.mouse.scroll(event[1], event[2])
+            except Exception as e:
+                print(f"Error simulating input for {event[1:]}: {e}")
+
+#######################
+### UINPUT CONSTANTS ###
+#######################
+
+# From linux/input-event-codes.h and linux/uinput.h
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_REL = 0x02
+SYN_REPORT = 0
+REL_X = 0x00
+REL_Y = 0x01
+REL_HWHEEL = 0x06
+REL_WHEEL = 0x08
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_SET_RELBIT = 0x40045566
+UI_DEV_SETUP = 0x405C5503
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+BUS_USB = 0x03
+INPUT_EVENT = struct.Struct("llHHi")
+WRITE_TIMEOUT = 0.05    # Seconds a write waits for room in the device's buffer before it drops the frame
+UINPUT_SETUP = struct.Struct("HHHH80sI")
+
+MOUSE_BUTTON_CODES = {"left": 0x110, "right": 0x111, "middle": 0x112}
+
+# Linux key codes for pynput key names, single characters and the tkinter key names the GUI binds
+KEY_CODES = {
+    "esc": 1, "escape": 1, "1": 2, "2": 3, "3": 4, "4": 5, "5": 6, "6": 7, "7": 8, "8": 9, "9": 10, "0": 11,
+    "-": 12, "minus": 12, "=": 13, "equal": 13, "backspace": 14, "tab": 15,
+    "q": 16, "w": 17, "e": 18, "r": 19, "t": 20, "y": 21, "u": 22, "i": 23, "o": 24, "p": 25,
+    "[": 26, "bracketleft": 26, "]": 27, "bracketright": 27, "enter": 28, "return": 28, "ctrl": 29, "ctrl_l": 29, "control_l": 29,
+    "a": 30, "s": 31, "d": 32, "f": 33, "g": 34, "h": 35, "j": 36, "k": 37, "l": 38,
+    ";": 39, "semicolon": 39, "'": 40, "apostrophe": 40, "`": 41, "grave": 41, "shift": 42, "shift_l": 42, "\\": 43, "backslash": 43,
+    "z": 44, "x": 45, "c": 46, "v": 47, "b": 48, "n": 49, "m": 50,
+    ",": 51, "comma": 51, ".": 52, "period": 52, "/": 53, "slash": 53, "shift_r": 54, "alt": 56, "alt_l": 56, " ": 57, "space": 57,
+    "caps_lock": 58, "f1": 59, "f2": 60, "f3": 61, "f4": 62, "f5": 63, "f6": 64, "f7": 65, "f8": 66, "f9": 67, "f10": 68,
+    "num_lock": 69, "scroll_lock": 70, "f11": 87, "f12": 88, "ctrl_r": 97, "control_r": 97, "print_screen": 99, "print": 99,
+    "alt_r": 100, "alt_gr": 100, "home": 102, "up": 103, "page_up": 104, "prior": 104, "left": 105, "right": 106, "end": 107,
+    "down": 108, "page_down": 109, "next": 109, "insert": 110, "delete": 111, "pause": 119,
+    "cmd": 125, "cmd_l": 125, "super_l": 125, "cmd_r": 126, "super_r": 126, "menu": 139,
+}
+
+class UInputBackend(Backend):
+    """Sends input through a virtual Linux input device created with /dev/uinput.\n\nEvery flush is written as a single event frame
+    closed by a `SYN_REPORT`, so chorded keybinds like `alt + f4` arrive at the same time. Needs write access to /dev/uinput."""
+    name = "uinput"
+    def __init__(self, device_name: str="Mist Input"):
+        super().__init__()
+        if not sys.platform.startswith("linux"):
+            raise OSError("The uinput backend only works on Linux.")
+        import fcntl
+        self.fd = os.open("/dev/uinput", os.O_WRONLY | os.O_NONBLOCK)
+        fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_KEY)
+        fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_REL)
+        for code in set(KEY_CODES.values()) | set(MOUSE_BUTTON_CODES.values()):
+            fcntl.ioctl(self.fd, UI_SET_KEYBIT, code)
+        for code in (REL_X, REL_Y, REL_WHEEL, REL_HWHEEL):
+            fcntl.ioctl(self.fd, UI_SET_RELBIT, code)
+        fcntl.ioctl(self.fd, UI_DEV_SETUP, UINPUT_SETUP.pack(BUS_USB, 0x1209, 0x4D49, 1, device_name.encode()[:79], 0))
+        fcntl.ioctl(self.fd, UI_DEV_CREATE)
+
+    def key_code(self, key):
+        """Return the Linux key code for a key name or character, or None if it has none."""
+        return KEY_CODES.get(key.lower())
+
+    def send(self, events):
+        frame = bytearray()
+        in_frame = set()    # Codes already in this frame. Pressing and releasing a key in one frame would be merged by readers
+        for event in events:
+            match event[0]:
+                case 0 | 1:     # KEY_DOWN, KEY_UP
+                    code = self.key_code(event[1])
+                    if code is None:
+                        print(f"Error simulating input for {event[1]}: no key code")
+                        continue
+                    writes = [(EV_KEY, code, 1 if event[0] == KEY_DOWN else 0)]
+                case 2 | 3:     # BUTTON_DOWN, BUTTON_UP
+                    code = MOUSE_BUTTON_CODES.get(event[1])
+                    if code is None:
+                        print(f"Error simulating input for {event[1]}: no button code")
+                        continue
+                    writes = [(EV_KEY, code, 1 if event[0] == BUTTON_DOWN else 0)]
+                case 4:         # MOVE
+                    code = None
+                    writes = [(EV_REL, REL_X, event[1]), (EV_REL, REL_Y, event[2])]
+                case 5:         # SCROLL
+                    code = None
+                    writes = [(EV_REL, REL_HWHEEL, event[1]), (EV_REL, REL_WHEEL, event[2])]
+            if code is not None:
+                if code in in_frame:
+                    frame += INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+                    in_frame.clear()
+                in_frame.add(code)
+            for type, code, value in writes:
+                if value or type == EV_KEY:
+                    frame += INPUT_EVENT.pack(0, 0, type, code, value)
+        frame += INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+        self.write(frame)
+
+    def write(self, frame: bytes):
+        """Write a frame to the device. The device is non-blocking, so a full buffer is waited on for up to `WRITE_TIMEOUT` seconds
+        and the rest of the frame is dropped if it stays full. Short writes are continued where they stopped."""
+        view = memoryview(frame)
+        while view:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                _, writable, _ = select.select([], [self.fd], [], WRITE_TIMEOUT)
+                if not writable:
+                    print(f"Error simulating input: /dev/uinput stayed busy, dropped {len(view) // INPUT_EVENT.size} events")
+                    return
+                continue
+            view = view[written:]
+
+    def close(self):
+        if self.fd is None:
+            return
+        import fcntl
+        fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+        os.close(self.fd)
+        self.fd = None
+
+BACKENDS = {backend.name: backend for backend in (PynputBackend, UInputBackend, NullBackend)}
+
+default_backend = None
+
+def get_default_backend():
+    """Return the backend shared by keybinds and controllers that weren't given one. Creates a `PynputBackend` on first use."""
+    global default_backend
+    if default_backend is None:
+        default_backend = PynputBackend()
+    return default_backend
+
+def create_backend(name: str):
+    """Create a backend by its name: "pynput", "uinput" or "null"."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Choose from {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
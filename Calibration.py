@@ -0,0 +1,133 @@
+from KeybindStore import get_store
+
+CALIBRATION_KEY = "calibration"     # Calibrations are saved in the keybindings file under this name, by controller GUID
+MIN_DEADZONE = 0.02
+MAX_DEADZONE = 0.5
+DEADZONE_MARGIN = 1.5               # The deadzone is this much bigger than the noise measured at rest
+MIN_RANGE = 0.3                     # Smaller movements away from rest don't count as moving a stick or trigger to its extremes
+
+def device_key(joystick):
+    """The key a joystick's calibration is saved under: its SDL GUID, or its name when pygame doesn't report a GUID."""
+    guid = joystick.get_guid() if hasattr(joystick, "get_guid") else None
+    return guid or joystick.get_name()
+
+class Calibration:
+    """The measured centre and range of every axis of a controller, and the deadzone that hides the noise of each stick at rest.\n\n
+    The filters turn it into a gain and offset per axis, so calibrated and uncalibrated axes cost the same."""
+    __slots__ = ("axes", "deadzones")
+    def __init__(self, axes: dict, deadzones: dict):
+        self.axes = axes            # Maps axis numbers to their (centre, low, high) raw values
+        self.deadzones = deadzones  # Maps stick names to their measured deadzone
+
+    def stick_transform(self, index: int):
+        """Return the (gain, offset) that moves the centre of a stick axis to 0 and its shortest side to ±1."""
+        if index not in self.axes:
+            return 1.0, 0.0
+        centre, low, high = self.axes[index]
+        reach = min(centre - low, high - centre)
+        if reach <= 0:
+            return 1.0, 0.0
+        return 1 / reach, -centre / reach
+
+    def trigger_transform(self, index: int, rest: float):
+        """Return the (gain, offset) that moves the resting value of a trigger to `rest` and the fully pulled value to 1.\n\n
+        Triggers that go down when they are pulled are turned around."""
+        if index not in self.axes:
+            return 1.0, 0.0
+        centre, low, high = self.axes[index]
+        pulled = high if high - centre >= centre - low else low
+        if pulled == centre:
+            return 1.0, 0.0
+        gain = (1 - rest) / (pulled - centre)
+        return gain, rest - centre * gain
+
+    def to_json(self):
+        return {"axes": {str(index): list(values) for index, values in self.axes.items()}, "deadzones": dict(self.deadzones)}
+
+    @classmethod
+    def from_json(cls, data: dict):
+        """Read a calibration as saved by `to_json`. Raises a `ValueError` if the data isn't a calibration."""
+        try:
+            axes = {int(index): tuple(float(value) for value in values) for index, values in data["axes"].items()}
+            deadzones = {name: float(deadzone) for name, deadzone in data.get("deadzones", {}).items()}
+        except (KeyError, TypeError, AttributeError, ValueError):
+            raise ValueError("not a controller calibration")
+        if not all(len(values) == 3 for values in axes.values()):
+            raise ValueError("every calibrated axis needs a centre, low and high value")
+        return cls(axes, deadzones)
+
+def read_calibration(joystick, filename: str="keybindings.bin"):
+    """Return the saved calibration of a joystick, or None if it was never calibrated."""
+    data = get_store(filename).get(CALIBRATION_KEY, device_key(joystick))
+    if data is None:
+        return None
+    try:
+        return Calibration.from_json(data)
+    except ValueError as e:
+        print(f"Error loading the calibration of {joystick.get_name()}: {e}")
+        return None
+
+def write_calibration(joystick, calibration: Calibration, filename: str="keybindings.bin"):
+    get_store(filename).put(CALIBRATION_KEY, device_key(joystick), calibration.to_json())
+
+class Calibrator:
+    """Measures the calibration of a joystick.\n\nCall `sample_rest` for a while with the sticks and triggers let go, then `sample_range`
+    while they are moved to their extremes, then `result`."""
+    def __init__(self, joystick, layout):
+        self.joystick = joystick
+        self.layout = layout
+        self.indices = tuple(layout.axis_indices)
+        self.rest_count = 0
+        self.rest_sums = dict.fromkeys(self.indices, 0.0)
+        self.rest_low = dict.fromkeys(self.indices, float("inf"))     # The range of the values at rest, which is their noise
+        self.rest_high = dict.fromkeys(self.indices, float("-inf"))
+        self.low = dict.fromkeys(self.indices, float("inf"))
+        self.high = dict.fromkeys(self.indices, float("-inf"))
+
+    def sample_rest(self):
+        """Sample the axes while the sticks and triggers are let go."""
+        self.rest_count += 1
+        for i in self.indices:
+            value = self.joystick.get_axis(i)
+            self.rest_sums[i] += value
+            self.rest_low[i] = min(self.rest_low[i], value)
+            self.rest_high[i] = max(self.rest_high[i], value)
+            self.low[i] = min(self.low[i], value)
+            self.high[i] = max(self.high[i], value)
+
+    def sample_range(self):
+        """Sample the axes while the sticks are moved around their edges and the triggers are pulled all the way."""
+        for i in self.indices:
+            value = self.joystick.get_axis(i)
+            self.low[i] = min(self.low[i], value)
+            self.high[i] = max(self.high[i], value)
+
+    def result(self):
+        """Return the measured calibration.\n\nRaises a `ValueError` if the axes weren't sampled at rest or a stick wasn't moved all the way
+        in every direction. Triggers that weren't pulled are left uncalibrated."""
+        if not self.rest_count:
+            raise ValueError("the sticks and triggers weren't sampled at rest")
+        axes = {}
+        for i in self.indices:
+            axes[i] = (self.rest_sums[i] / self.rest_count, self.low[i], self.high[i])
+        calibration = Calibration(axes, {})
+        for name, type, indices in self.layout.inputs:
+            if type == "trigger":
+                centre, low, high = axes[indices[0]]
+                if max(high - centre, centre - low) < MIN_RANGE:
+                    del axes[indices[0]]
+                continue
+            if type != "stick":
+                continue
+            for i in indices:
+                centre, low, high = axes[i]
+                if min(centre - low, high - centre) < MIN_RANGE:
+                    raise ValueError(f"'{name}' wasn't moved all the way in every direction")
+            noise = 0.0
+            for i in indices:
+                gain, _ = calibration.stick_transform(i)
+                centre = axes[i][0]
+                noise = max(noise, abs(self.rest_high[i] - centre) * gain, abs(self.rest_low[i] - centre) * gain)
+            # The noise of both axes can add up on a diagonal
+            calibration.deadzones[name] = min(max(noise * 2 ** 0.5 * DEADZONE_MARGIN, MIN_DEADZONE), MAX_DEADZONE)
+        return calibration
@@ -0,0 +1,53 @@
+import tkinter as tk
+from tkinter import messagebox, ttk
+from Calibration import Calibrator
+
+REST_TIME = 1000        # Milliseconds the sticks and triggers are sampled at rest
+SAMPLE_INTERVAL = 10    # Milliseconds between samples
+
+class CalibrationWindow:
+    """Walks through calibrating the sticks and triggers of a controller.\n\nThe axes are sampled on the input engine's thread, which owns the joystick."""
+    def __init__(self, root, controller, engine):
+        self.root = root
+        self.root.title("Calibrate")
+        self.controller = controller
+        self.engine = engine
+        self.calibrator = Calibrator(controller.joystick, controller.layout)
+        self.sampling = None    # The Calibrator method that is called every sample, or None when nothing is sampled
+
+        self.label = ttk.Label(self.root, wraplength=320, justify=tk.LEFT)
+        self.label.pack(padx=10, pady=10)
+        self.button = ttk.Button(self.root, text="Start", command=self.sample_rest)
+        self.button.pack(pady=5)
+        self.label.config(text=f"Let go of the sticks and triggers of {controller.joystick.get_name()}, then press Start.")
+
+    def sample(self):
+        if self.sampling is None:
+            return
+        self.engine.send(self.sampling)
+        self.root.after(SAMPLE_INTERVAL, self.sample)
+
+    def sample_rest(self):
+        self.label.config(text="Keep the sticks and triggers let go...")
+        self.button.config(state=tk.DISABLED)
+        self.sampling = self.calibrator.sample_rest
+        self.sample()
+        self.root.after(REST_TIME, self.sample_range)
+
+    def sample_range(self):
+        self.label.config(text="Move the sticks around their edges a few times and pull the triggers all the way, then press Finish.")
+        self.button.config(text="Finish", state=tk.NORMAL, command=self.finish)
+        self.sampling = self.calibrator.sample_range
+
+    def finish(self):
+        self.sampling = None
+        try:
+            # Sent through the engine so it runs after the samples that are still queued
+            calibration = self.engine.send(self.calibrator.result).result()
+        except ValueError as e:
+            messagebox.showerror("Calibration failed", f"{e}. Try again.", parent=self.root)
+            self.sampling = self.calibrator.sample_range
+            self.sample()
+            return
+        self.engine.send(self.controller.save_calibration, calibration)
+        self.root.destroy()
@@ -1,124 +1,167 @@
-def GetControllerLayout(controller_name: str):
-    """Get the controller layout for the given controller name."""
-    match controller_name:
-        case "PS4 Controller":
-            return PS4ControllerLayout()
-        case "Nintendo Switch Joy-Con (L)":
-            return LeftJoyconLayout()
-        case "Nintendo Switch Joy-Con (R)":
-            return RightJoyconLayout()
-        case "Nintendo Switch Joy-Con (L/R)":
-            return DualJoyconLayout()
-        
-##########################
-### CONTROLLER LAYOUTS ###
-##########################
+import json
+import os
+import pickle
+from array import array
+from Filters import filter_settings
 
-# Controller layouts are dictionaries that map button names to input types.
-# The dictionaries are ordered in what the controller outputs as button 0, 1, 2, etc.
-# This logic also applies to axis (and triggers), but they have their own output type.
+# Controller layouts are json files in the layouts folders. Every layout has the controller's name, the SDL GUIDs it matches and
+# its inputs. Every input names its type and the joystick numbers it reads, so numbers the controller outputs but that aren't
+# mapped are simply left out.
+#
+#   {"name": "PS4 Controller", "guids": [], "inputs": {"x": ["button", 0], "LeftStick": ["stick", 0, 1], "l2": ["trigger", 4], "dpad": ["hat", 0]}}
+#
+# Buttons read a button number, sticks an x and a y axis number, triggers an axis number and hats a hat number. An optional
+# "filters" object changes the deadzone, smoothing and thresholds of sticks and triggers, see Filters.py.
+LAYOUT_DIRECTORIES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts"),
+    os.path.join(os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "mist-input", "layouts"),    # Custom layouts, these win over the built in ones
+]
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "mist-input", "layouts.cache")
+CACHE_VERSION = 3
+INPUT_SIZES = {"button": 1, "stick": 2, "trigger": 1, "hat": 1}   # The amount of joystick numbers every input type reads
 
-def PS4ControllerLayout():
-    inputs = {
-        "x": 0,
-        "circle": 0,
-        "square": 0,
-        "triangle": 0,
-        "share": 0,
-        "ps": 0,
-        "options": 0,
-        "l3": 0,
-        "r3": 0,
-        "l1": 0,
-        "r1": 0,
-        "up": 0,
-        "down": 0,
-        "left": 0,
-        "right": 0,
-        "touchpad": 0,
-        "LeftStick": 1,
-        "RightStick": 1,
-        "l2": 2,
-        "r2": 2
-        }
-    return inputs
+class Layout:
+    """A controller layout compiled into the joystick numbers every input reads.\n\n`inputs` is a tuple of `(name, type, indices)` with
+    the button number of a button, the x and y axis numbers of a stick, the axis number of a trigger and the hat number of a hat.
+    `button_indices`, `axis_indices` and `hat_indices` hold every mapped number in order, for the controller's state buffers.
+    `filters` maps the names of sticks and triggers to the filter options the layout changes."""
+    __slots__ = ("name", "guids", "inputs", "button_indices", "axis_indices", "hat_indices", "filters")
+    def __init__(self, name: str, guids, inputs, filters: dict=None):
+        self.name = name
+        self.guids = tuple(guids)
+        self.inputs = tuple(inputs)
+        self.filters = filters or {}
+        self.button_indices = array("i", sorted(index for _, type, indices in self.inputs if type == "button" for index in indices))
+        self.axis_indices = array("i", sorted(index for _, type, indices in self.inputs if type in ("stick", "trigger") for index in indices))
+        self.hat_indices = array("i", sorted(index for _, type, indices in self.inputs if type == "hat" for index in indices))
 
-def LeftJoyconLayout():
-    inputs = {
-        "right": 0,
-        "down": 0,
-        "up": 0,
-        "left": 0,
-        "DUMMY1": -3,
-        "capture": 0,
-        "minus": 0,
-        "stick": 0,
-        "DUMMY2": -3,
-        "sl": 0,
-        "sr": 0,
-        "DUMMY3": -3,
-        "DUMMY4": -3,
-        "DUMMY5": -3,
-        "DUMMY6": -3,
-        "DUMMY7": -3,
-        "DUMMY8": -3,
-        "l": 0,
-        "DUMMY9": -3,
-        "zl": 0,
-        "Stick": 1,
-        }
-    return inputs
+    @classmethod
+    def compile(cls, data: dict):
+        """Compile a layout from its json data. Raises a `ValueError` if the data isn't a valid layout."""
+        if not isinstance(data.get("name"), str) or not isinstance(data.get("inputs"), dict):
+            raise ValueError("a layout needs a name and inputs")
+        inputs = []
+        for name, value in data["inputs"].items():
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"'{name}' must be a list of its type and joystick numbers")
+            type, *indices = value
+            if type not in INPUT_SIZES:
+                raise ValueError(f"'{name}' has unknown input type '{type}'")
+            if len(indices) != INPUT_SIZES[type] or not all(isinstance(index, int) and index >= 0 for index in indices):
+                raise ValueError(f"'{name}' needs {INPUT_SIZES[type]} joystick number(s) for a {type}")
+            inputs.append((name, type, tuple(indices)))
+        filters = data.get("filters", {})
+        if not isinstance(filters, dict):
+            raise ValueError("filters must map stick and trigger names to their filter options")
+        types = {name: type for name, type, _ in inputs}
+        for name, options in filters.items():
+            if types.get(name) not in ("stick", "trigger"):
+                raise ValueError(f"'{name}' in filters is not a stick or trigger")
+            if not isinstance(options, dict):
+                raise ValueError(f"the filter of '{name}' must be an object of filter options")
+            filter_settings(types[name], options)
+        return cls(data["name"], data.get("guids", ()), inputs, filters)
 
-def RightJoyconLayout():
-    inputs = {
-        "x": 0,
-        "a": 0,
-        "y": 0,
-        "b": 0,
-        "DUMMY1": -3,
-        "home": 0,
-        "plus": 0,
-        "stick": 0,
-        "DUMMY2": -3,
-        "sl": 0,
-        "sr": 0,
-        "DUMMY3": -3,
-        "DUMMY4": -3,
-        "DUMMY5": -3,
-        "DUMMY6": -3,
-        "DUMMY7": -3,
-        "r": 0,
-        "DUMMY9": -3,
-        "zr": 0,
-        "Stick": 1,
-        }
-    return inputs
+def GenericLayout(numbuttons: int, numaxes: int, numhats: int=0):
+    """Make a layout for a controller that has none, from the amount of buttons and axes it has.\n\nAxes are paired into sticks and an
+    axis left over becomes a trigger."""
+    inputs = [(f"button {i}", "button", (i,)) for i in range(numbuttons)]
+    inputs += [(f"stick {i // 2 + 1}", "stick", (i, i + 1)) for i in range(0, numaxes - 1, 2)]
+    if numaxes % 2:
+        inputs.append((f"axis {numaxes - 1}", "trigger", (numaxes - 1,)))
+    inputs += [(f"hat {i}", "hat", (i,)) for i in range(numhats)]
+    return Layout("Generic Controller", (), inputs)
 
-def DualJoyconLayout():
-    inputs = {
-        "a": 0,
-        "b": 0,
-        "x": 0,
-        "y": 0,
-        "minus": 0,
-        "home": 0,
-        "plus": 0,
-        "stick (L)": 0,
-        "stick (R)": 0,
-        "l": 0,
-        "r": 0,
-        "up": 0,
-        "down": 0,
-        "left": 0,
-        "right": 0,
-        "capture": 0,
-        "sr (R)": 0,
-        "sr (L)": 0,
-        "sl (R)": 0,
-        "sl (L)": 0,
-        "LeftStick": 1,
-        "RightStick": 1,
-        "zl": 2,
-        "zr": 2,
-        }
-    return inputs
\ No newline at end of file
+class LayoutRegistry:
+    """Every controller layout in the layout folders, indexed by SDL GUID and by controller name.\n\nThe json files are only read
+    when one of them was added, removed or changed since the compiled layouts were cached on disk, so finding a layout doesn't get
+    slower as more layouts are added."""
+    def __init__(self, directories=LAYOUT_DIRECTORIES, cache_file: str=CACHE_FILE):
+        self.directories = directories
+        self.cache_file = cache_file
+        self.by_guid = {}
+        self.by_name = {}
+        self.generic = {}       # Maps (buttons, axes, hats) counts to generated layouts
+        self.files = None       # (path, mtime, size) of every layout file when the layouts were last loaded
+
+    def layout_files(self):
+        """Return the (path, mtime, size) of every layout file, in the order they are loaded."""
+        files = []
+        for directory in self.directories:
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_mtime_ns, stat.st_size))
+        return files
+
+    def load(self):
+        """Load the layouts from the cache, or compile them from the json files if the cache is out of date."""
+        files = self.layout_files()
+        layouts = self.read_cache(files)
+        if layouts is None:
+            layouts = []
+            for path, _, _ in files:
+                try:
+                    with open(path, "r") as f:
+                        layouts.append(Layout.compile(json.load(f)))
+                except (OSError, ValueError) as e:
+                    print(f"Error loading controller layout {path}: {e}")
+            self.write_cache(files, layouts)
+        self.by_guid = {}
+        self.by_name = {}
+        # Later files replace earlier ones, so custom layouts replace the built in ones
+        for layout in layouts:
+            self.by_name[layout.name] = layout
+            for guid in layout.guids:
+                self.by_guid[guid] = layout
+        self.files = files
+
+    def read_cache(self, files):
+        """Return the cached layouts, or None if there is no cache or it was made from other files."""
+        try:
+            with open(self.cache_file, "rb") as f:
+                version, cached_files, layouts = pickle.load(f)
+        except Exception:
+            return None
+        if version != CACHE_VERSION or cached_files != files:
+            return None
+        return layouts
+
+    def write_cache(self, files, layouts):
+        """Cache the compiled layouts. The cache is only an optimisation, so failing to write it is ignored."""
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temp_filename = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_filename, "wb") as f:
+                pickle.dump((CACHE_VERSION, files, layouts), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_filename, self.cache_file)
+        except OSError:
+            pass
+
+    def get(self, name: str, guid: str=None):
+        """Return the layout for a controller GUID or name, or None if there is none."""
+        if self.files is None:
+            self.load()
+        if guid and guid in self.by_guid:
+            return self.by_guid[guid]
+        return self.by_name.get(name)
+
+    def get_generic(self, numbuttons: int, numaxes: int, numhats: int=0):
+        key = (numbuttons, numaxes, numhats)
+        if key not in self.generic:
+            self.generic[key] = GenericLayout(*key)
+        return self.generic[key]
+
+registry = LayoutRegistry()
+
+def GetControllerLayout(joystick):
+    """Get the compiled layout of a joystick by its SDL GUID or name. Joysticks without a layout get a generic one."""
+    guid = joystick.get_guid() if hasattr(joystick, "get_guid") else None
+    layout = registry.get(joystick.get_name(), guid)
+    if layout is None:
+        layout = registry.get_generic(joystick.get_numbuttons(), joystick.get_numaxes(), joystick.get_numhats())
+    return layout
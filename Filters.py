@@ -0,0 +1,220 @@
+import math
+
+# Sticks and triggers are filtered before they press anything. A layout can change the filter of any of its sticks and triggers:
+#
+#   "filters": {"LeftStick": {"deadzone": 0.15, "smoothing": "one-euro"}, "l2": {"threshold": 0.3}}
+#
+# Every value is first smoothed, then the deadzone is cut out and the rest is scaled back to the full range. Sticks have a round
+# deadzone, so diagonals aren't cut off, and triggers are scaled from their resting value to 0-1. The threshold and hysteresis are
+# used by the stick or trigger itself: a direction or trigger is pressed past the threshold and only released once it falls below
+# the threshold minus the hysteresis, so a value that hovers around the threshold doesn't press and release over and over.
+FILTER_DEFAULTS = {
+    "stick": {
+        "deadzone": 0.1,        # Deflection that is ignored
+        "outer": 1.0,           # Deflection that counts as fully pushed
+        "threshold": 0.1,       # Scaled deflection that presses a direction
+        "hysteresis": 0.05,
+        "smoothing": "none",    # "none", "ema" or "one-euro"
+        "time": 0.03,           # Time constant in seconds of "ema" smoothing
+        "min_cutoff": 1.0,      # Cutoff frequency in Hz of "one-euro" smoothing when the value holds still
+        "beta": 5.0,            # How much faster "one-euro" smoothing follows fast movements
+    },
+    "trigger": {
+        "rest": -1.0,           # Value of the released trigger
+        "deadzone": 0.0,
+        "threshold": 0.5,       # Scaled value that presses the trigger
+        "hysteresis": 0.1,
+        "smoothing": "none",
+        "time": 0.03,
+        "min_cutoff": 1.0,
+        "beta": 5.0,
+    },
+}
+SMOOTHING = ("none", "ema", "one-euro")
+SETTLED = 0.001     # Smoothing snaps to the input once it is this close
+
+def filter_settings(type: str, options: dict=None):
+    """Return the filter settings of a stick or trigger with the options of a layout applied.\n\nRaises a `ValueError` for unknown options or values."""
+    settings = dict(FILTER_DEFAULTS[type])
+    for option, value in (options or {}).items():
+        if option not in settings:
+            raise ValueError(f"unknown {type} filter option '{option}'")
+        if option == "smoothing":
+            if value not in SMOOTHING:
+                raise ValueError(f"smoothing must be one of {', '.join(SMOOTHING)}, got '{value}'")
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f"filter option '{option}' must be a number")
+        settings[option] = value
+    if settings["time"] <= 0 or settings["min_cutoff"] <= 0:
+        raise ValueError("the smoothing time and min_cutoff must be more than 0")
+    if settings.get("rest", -1.0) >= 1:
+        raise ValueError("the resting value of a trigger must be less than 1")
+    if not 0 <= settings["deadzone"] < settings.get("outer", 1.0) <= 1:
+        raise ValueError("the deadzone must be at least 0 and smaller than the outer deadzone, which can be at most 1")
+    return settings
+
+class Ema:
+    """Exponential moving average with a time constant, so it smooths the same no matter how often it is updated."""
+    __slots__ = ("time", "value")
+    def __init__(self, time: float, value: float):
+        self.time = time
+        self.value = value
+
+    def __call__(self, target: float, dt: float):
+        if dt <= 0:
+            return self.value
+        self.value += (1 - math.exp(-dt / self.time)) * (target - self.value)
+        return self.value
+
+class OneEuro:
+    """The 1€ filter: smooths a lot while the value holds still and little while it moves fast, so it removes jitter without adding lag to quick movements."""
+    __slots__ = ("min_cutoff", "beta", "value", "speed")
+    D_CUTOFF = 1.0      # Cutoff frequency in Hz of the speed estimate
+    def __init__(self, min_cutoff: float, beta: float, value: float):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.value = value
+        self.speed = 0.0
+
+    def __call__(self, target: float, dt: float):
+        if dt <= 0:
+            return self.value
+        speed = (target - self.value) / dt
+        self.speed += self.alpha(self.D_CUTOFF, dt) * (speed - self.speed)
+        cutoff = self.min_cutoff + self.beta * abs(self.speed)
+        self.value += self.alpha(cutoff, dt) * (target - self.value)
+        return self.value
+
+    @staticmethod
+    def alpha(cutoff: float, dt: float):
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+def make_smoother(settings: dict, value: float):
+    """Return a smoother for the settings that starts at `value`, or None if smoothing is off."""
+    match settings["smoothing"]:
+        case "ema":
+            return Ema(settings["time"], value)
+        case "one-euro":
+            return OneEuro(settings["min_cutoff"], settings["beta"], value)
+    return None
+
+class StickFilter:
+    """Calibrates and smooths a stick and applies a round deadzone that is scaled away, so the output starts at 0 right past the deadzone."""
+    __slots__ = ("indices", "settings", "gain_x", "offset_x", "gain_y", "offset_y", "deadzone", "scale", "smooth_x", "smooth_y", "raw", "out", "last_time", "settling")
+    def __init__(self, indices, settings: dict, calibration=None):
+        self.indices = tuple(indices)
+        self.settings = settings
+        # The calibration as a gain and offset per axis, which are 1 and 0 for an uncalibrated stick
+        self.gain_x, self.offset_x = calibration.stick_transform(indices[0]) if calibration else (1.0, 0.0)
+        self.gain_y, self.offset_y = calibration.stick_transform(indices[1]) if calibration else (1.0, 0.0)
+        self.deadzone = settings["deadzone"]
+        self.scale = 1 / (settings["outer"] - settings["deadzone"])
+        self.smooth_x = make_smoother(settings, 0.0)
+        self.smooth_y = make_smoother(settings, 0.0)
+        self.raw = (0.0, 0.0)       # The last raw values, to keep smoothing after the stick stopped sending events
+        self.out = (0.0, 0.0)       # The last filtered values
+        self.last_time = None
+        self.settling = False       # Whether the smoothed values haven't caught up with the raw values yet
+
+    def filter(self, x: float, y: float, now: float):
+        self.raw = (x, y)
+        x = x * self.gain_x + self.offset_x
+        y = y * self.gain_y + self.offset_y
+        if self.smooth_x:
+            dt = now - self.last_time if self.last_time is not None else 0.0
+            self.last_time = now
+            sx, sy = self.smooth_x(x, dt), self.smooth_y(y, dt)
+            self.settling = abs(sx - x) > SETTLED or abs(sy - y) > SETTLED
+            if self.settling:
+                x, y = sx, sy
+            else:
+                self.smooth_x.value, self.smooth_y.value = x, y
+        magnitude = math.hypot(x, y)
+        if magnitude <= self.deadzone:
+            self.out = (0.0, 0.0)
+        else:
+            scale = min((magnitude - self.deadzone) * self.scale, 1.0) / magnitude
+            self.out = (x * scale, y * scale)
+        return self.out
+
+    def apply(self, raw, out, now: float):
+        """Filter the stick's values of the raw axis buffer into the output buffer. A stick that didn't move isn't filtered again."""
+        ix, iy = self.indices
+        x, y = raw[ix], raw[iy]
+        if self.settling or x != self.raw[0] or y != self.raw[1]:
+            self.filter(x, y, now)
+        out[ix], out[iy] = self.out
+
+    def read(self, joystick, now: float):
+        """Read and filter the stick's values from the joystick."""
+        ix, iy = self.indices
+        return self.filter(joystick.get_axis(ix), joystick.get_axis(iy), now)
+
+    def step(self, now: float):
+        """Filter the last raw values again, to let the smoothing catch up."""
+        return self.filter(*self.raw, now)
+
+class TriggerFilter:
+    """Calibrates and smooths a trigger and scales it from its resting value to 0-1, with the deadzone cut out."""
+    __slots__ = ("indices", "settings", "gain", "offset", "rest", "deadzone", "scale", "smooth", "raw", "out", "last_time", "settling")
+    def __init__(self, indices, settings: dict, calibration=None):
+        self.indices = tuple(indices)
+        self.settings = settings
+        self.rest = settings["rest"]
+        self.gain, self.offset = calibration.trigger_transform(indices[0], self.rest) if calibration else (1.0, 0.0)
+        self.deadzone = settings["deadzone"]
+        self.scale = 1 / ((1 - self.rest) * (1 - self.deadzone))
+        self.smooth = make_smoother(settings, self.rest)
+        self.raw = self.rest
+        self.out = 0.0
+        self.last_time = None
+        self.settling = False
+
+    def filter(self, value: float, now: float):
+        self.raw = value
+        value = value * self.gain + self.offset
+        if self.smooth:
+            dt = now - self.last_time if self.last_time is not None else 0.0
+            self.last_time = now
+            smoothed = self.smooth(value, dt)
+            self.settling = abs(smoothed - value) > SETTLED
+            if self.settling:
+                value = smoothed
+            else:
+                self.smooth.value = value
+        pulled = value - self.rest - self.deadzone * (1 - self.rest)
+        self.out = min(pulled * self.scale, 1.0) if pulled > 0 else 0.0
+        return self.out
+
+    def apply(self, raw, out, now: float):
+        i = self.indices[0]
+        if self.settling or raw[i] != self.raw:
+            self.filter(raw[i], now)
+        out[i] = self.out
+
+    def read(self, joystick, now: float):
+        return (self.filter(joystick.get_axis(self.indices[0]), now),)
+
+    def step(self, now: float):
+        return (self.filter(self.raw, now),)
+
+class FilterPipeline:
+    """The filters of every stick and trigger of a layout.\n\n`run` filters the whole raw axis buffer in one pass, before the controller
+    compares it with the last poll, so noise inside a deadzone never reaches the inputs. A measured calibration replaces the deadzones
+    of the layout."""
+    def __init__(self, layout, calibration=None):
+        self.filters = {}       # Maps input names to their filter
+        for name, type, indices in layout.inputs:
+            if type == "stick":
+                settings = filter_settings("stick", layout.filters.get(name))
+                if calibration and name in calibration.deadzones:
+                    settings["deadzone"] = min(calibration.deadzones[name], settings["outer"] / 2)
+                self.filters[name] = StickFilter(indices, settings, calibration)
+            elif type == "trigger":
+                self.filters[name] = TriggerFilter(indices, filter_settings("trigger", layout.filters.get(name)), calibration)
+        self.pipeline = tuple(self.filters.values())
+
+    def run(self, raw, out, now: float):
+        for filter in self.pipeline:
+            filter.apply(raw, out, now)
@@ -0,0 +1,318 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import pygame
+import VirtualController
+from Backends import Backend, get_default_backend
+from LatencyStats import LatencyStats
+from Scheduler import Scheduler
+
+# The pygame events the engine reacts to. Everything else is drained and ignored.
+JOYSTICK_EVENTS = (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYAXISMOTION, pygame.JOYHATMOTION)
+# Joysticks being connected and disconnected
+DEVICE_EVENTS = (pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED)
+# Every event the engine handles, taken from the queue together so they keep their order
+HANDLED_EVENTS = JOYSTICK_EVENTS + DEVICE_EVENTS
+# Posted to wake the engine up when a command is sent
+WAKE_EVENT = pygame.event.custom_type()
+
+class InputEngine:
+    """Maps the input of one or more controllers on its own thread.\n\nThe engine blocks on pygame joystick events instead of polling, so it only does work when
+    something on a controller changes. Every mapped joystick gets its own `Controller`, found by the instance id of its events, and all of
+    them share the engine's event pump, scheduler and injection backend. Joysticks are connected and disconnected through pygame's device
+    events, and a reconnected joystick gets the controller, and so the keybinds, it had before. The engine thread owns the joysticks, the controllers and the backend.
+    Other threads change them by sending commands with `send`, and read throttled snapshots of the controller state with `get_snapshot`.
+    Only pygame's joystick module and the display module, which delivers the events, are initialised, not audio or fonts."""
+    def __init__(self, backend: Backend=None, refresh_rate: int=10, snapshot_rate: int=30, stats: bool=False):
+        self.backend = backend or get_default_backend() # Everything queued on the backend is sent once per engine loop
+        self.scheduler = Scheduler()                    # Runs the turbo keybinds of every controller
+        self.controllers = {}                           # Maps joystick instance ids to the controllers mapping them
+        self.joysticks = {}                             # Maps instance ids to every connected joystick
+        self.device_keys = {}                           # Maps instance ids to the (guid, name) of their joystick, to recognise it when it reconnects
+        self.disconnected = []                          # (device key, old instance id, controller) of mapped joysticks that were disconnected
+        self.devices_changed = 0                        # Counts joystick connects and disconnects, so other threads can see the list changed
+        self.stats_enabled = stats                      # Whether the latency from controller event to injected input is measured
+        self.stats = {}                                 # Maps joystick instance ids to their LatencyStats, when enabled
+        self.timings = []                               # (stats, input name, received, mapped) timestamps of the events in this loop
+        self.commands = queue.Queue()                   # Functions sent from other threads, run on the engine thread
+        self.refresh_rate = refresh_rate                # Milliseconds between mouse movements of sticks in mouse mode
+        self.snapshot_interval = 1 / snapshot_rate      # Minimum seconds between two snapshots sent to the GUI
+        self.idle_timeout = 100                         # Milliseconds to wait for an event when nothing is active
+        self.thread = None
+        self.running = False
+        self.ready = threading.Event()                  # Set once the engine thread has initialised pygame
+        self.init_error = None                          # The error the engine thread failed to initialise pygame with
+        self.snapshots = {}                             # Maps joystick instance ids to the latest snapshot of their controller
+        self.dirty = set()                              # Instance ids of the controllers that changed since their last snapshot
+        self.next_snapshot = 0
+        self.next_mouse_move = 0
+
+    def start(self):
+        """Start the engine thread and wait until it has initialised pygame. Raises the error if that fails.\n\nSDL delivers events on the
+        thread that initialised it, so the engine thread initialises pygame itself instead of the thread that starts it."""
+        if self.running:
+            return
+        self.ready = threading.Event()
+        self.init_error = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="InputEngine", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.init_error:
+            self.stop()
+            raise self.init_error
+
+    def stop(self):
+        """Stop the engine thread and wait for it to finish."""
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def send(self, function, *args):
+        """Run `function(*args)` on the engine thread.\n\nReturns a `Future` with the result. When the engine isn't running the function is run right away."""
+        future = Future()
+        if not self.running:
+            self.run_command(future, function, args)
+            return future
+        self.commands.put((future, function, args))
+        if not self.running:
+            # The engine stopped between the check and the put, and may already have drained the queue
+            self.drain_commands()
+            return future
+        pygame.event.post(pygame.event.Event(WAKE_EVENT))
+        return future
+
+    def run_command(self, future: Future, function, args):
+        """Run a single command and store its result in the future."""
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        self.dirty.update(self.controllers)
+        if not self.running:
+            try:
+                self.backend.flush()
+            except Exception as e:
+                print(f"Error sending simulated input: {e}")
+
+    def get_joysticks(self):
+        """Return all connected joysticks. Initialises the joystick module and opens every joystick the first time it is called."""
+        if not pygame.joystick.get_init():
+            pygame.joystick.init()
+            for i in range(pygame.joystick.get_count()):
+                self.connect(i)
+        return list(self.joysticks.values())
+
+    def connect(self, device_index: int):
+        """Open a newly connected joystick. Restores the controller of a mapped joystick that was disconnected before."""
+        joystick = pygame.joystick.Joystick(device_index)
+        joystick.init()
+        instance_id = joystick.get_instance_id()
+        if instance_id in self.joysticks:
+            return
+        self.joysticks[instance_id] = joystick
+        device_key = (joystick.get_guid(), joystick.get_name())
+        self.device_keys[instance_id] = device_key
+        self.devices_changed += 1
+        for i, (key, old_instance_id, controller) in enumerate(self.disconnected):
+            if key == device_key:
+                del self.disconnected[i]
+                controller.set_joystick(joystick)
+                self.controllers[instance_id] = controller
+                if old_instance_id in self.stats:
+                    self.stats[instance_id] = self.stats.pop(old_instance_id)
+                self.dirty.add(instance_id)
+                break
+
+    def disconnect(self, instance_id: int):
+        """Forget a disconnected joystick. Its controller is kept so it can be restored when the joystick reconnects."""
+        if self.joysticks.pop(instance_id, None) is None:
+            return
+        device_key = self.device_keys.pop(instance_id)
+        self.devices_changed += 1
+        controller = self.controllers.get(instance_id)
+        if controller:
+            self.remove_joystick(instance_id)
+            self.disconnected.append((device_key, instance_id, controller))
+
+    def add_joystick(self, joystick: pygame.joystick):
+        """Start mapping a joystick and return its controller. A joystick that is already mapped keeps its controller.\n\n
+        Must be called on the engine thread, use `send` from other threads."""
+        instance_id = joystick.get_instance_id()
+        if instance_id in self.controllers:
+            return self.controllers[instance_id]
+        controller = VirtualController.Controller(self.backend, self.scheduler)
+        controller.set_joystick(joystick)
+        self.controllers[instance_id] = controller
+        if self.stats_enabled:
+            self.stats[instance_id] = LatencyStats()
+        self.dirty.add(instance_id)
+        return controller
+
+    def remove_joystick(self, instance_id: int):
+        """Stop mapping a joystick. Releases everything its controller still holds."""
+        controller = self.controllers.pop(instance_id, None)
+        if controller:
+            controller.release_all()
+        self.snapshots = {id: snapshot for id, snapshot in self.snapshots.items() if id != instance_id}
+        self.dirty.discard(instance_id)
+
+    def get_controller(self, instance_id: int):
+        return self.controllers.get(instance_id)
+
+    def get_snapshot(self, instance_id: int):
+        """Return the latest snapshot of a controller. The same object is returned until its state changes."""
+        return self.snapshots.get(instance_id)
+
+    def report(self):
+        """Return the latency report of every controller."""
+        lines = []
+        # Copy the dictionaries first, the engine thread adds controllers while the report is made on another thread
+        controllers = dict(self.controllers)
+        for instance_id, stats in list(self.stats.items()):
+            controller = controllers.get(instance_id)
+            name = controller.joystick.get_name() if controller else "Disconnected controller"
+            lines.append(f"{name} ({instance_id})")
+            lines.append(stats.report())
+        return "\n".join(lines) if lines else "No controllers mapped."
+
+    def run(self):
+        """The engine loop. Runs until `stop` is called.\n\nAn error while handling an event, running a command or task or sending input
+        is reported and the loop carries on. If the loop itself fails the engine stops, fails the commands that are still queued and
+        releases everything that is held."""
+        try:
+            if not pygame.display.get_init():
+                pygame.display.init()   # Pygame only delivers events once the display module is initialised
+            self.get_joysticks()
+        except Exception as e:
+            self.init_error = e
+            self.running = False
+            return
+        finally:
+            self.ready.set()
+        stopped = False
+        try:
+            while self.running:
+                self.step()
+            stopped = True
+        except Exception as e:
+            print(f"Input engine stopped on an error: {e}")
+        finally:
+            self.running = False
+            # Run whatever was sent while the engine was stopping. After an error nothing runs on the engine thread any more
+            self.drain_commands(run=stopped)
+            # Release everything that is still held, so no key stays down after the engine stopped
+            for controller in list(self.controllers.values()):
+                try:
+                    controller.release_all()
+                except Exception as e:
+                    print(f"Error releasing {controller.joystick.get_name()}: {e}")
+            try:
+                self.backend.release_all()
+                self.backend.flush()
+            except Exception as e:
+                print(f"Error releasing the simulated input: {e}")
+
+    def step(self):
+        """Wait for the next event or scheduled task and handle everything that is due."""
+        event = pygame.event.wait(self.get_timeout())
+        received = time.perf_counter()
+        now = time.monotonic()
+        self.dispatch(event, received)
+        # Handle everything else that is already queued in one go
+        events = pygame.event.get(HANDLED_EVENTS)
+        received = time.perf_counter()
+        for event in events:
+            self.dispatch(event, received)
+        pygame.event.clear(WAKE_EVENT)
+        self.drain_commands()
+
+        self.scheduler.run_due(now)
+        if now >= self.next_mouse_move and self.moving_mouse():
+            for controller in self.controllers.values():
+                try:
+                    controller.move_mouse()
+                except Exception as e:
+                    print(f"Error moving the mouse for {controller.joystick.get_name()}: {e}")
+            self.next_mouse_move = now + self.refresh_rate / 1000
+        try:
+            self.backend.flush()
+        except Exception as e:
+            print(f"Error sending simulated input: {e}")
+        if self.timings:
+            injected = time.perf_counter()
+            for stats, name, received, mapped in self.timings:
+                stats.record(name, received, mapped, injected)
+            self.timings.clear()
+
+        if self.dirty and now >= self.next_snapshot:
+            snapshots = dict(self.snapshots)
+            for instance_id in self.dirty:
+                if instance_id in self.controllers:
+                    snapshots[instance_id] = self.controllers[instance_id].snapshot()
+            self.snapshots = snapshots
+            self.dirty.clear()
+            self.next_snapshot = now + self.snapshot_interval
+
+    def drain_commands(self, run: bool=True):
+        """Run every queued command, or fail them when `run` is False."""
+        while True:
+            try:
+                future, function, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if run:
+                self.run_command(future, function, args)
+            else:
+                future.set_exception(RuntimeError("the input engine stopped on an error"))
+
+    def dispatch(self, event: pygame.event.Event, received: float=0):
+        """Handle a joystick or device event. Other events are ignored."""
+        if event.type in JOYSTICK_EVENTS:
+            self.handle_event(event, received)
+        elif event.type in DEVICE_EVENTS:
+            try:
+                if event.type == pygame.JOYDEVICEADDED:
+                    self.connect(event.device_index)
+                else:
+                    self.disconnect(event.instance_id)
+            except Exception as e:
+                print(f"Error handling {pygame.event.event_name(event.type)}: {e}")
+
+    def handle_event(self, event: pygame.event.Event, received: float=0):
+        """Pass a single joystick event on to the controller of its joystick. `received` is the time.perf_counter() time the event was received."""
+        controller = self.controllers.get(event.instance_id)
+        if not controller:
+            return
+        try:
+            input = controller.handle_event(event)
+        except Exception as e:
+            print(f"Error handling {pygame.event.event_name(event.type)} of {controller.joystick.get_name()}: {e}")
+            return
+        if self.stats_enabled and input:
+            self.timings.append((self.stats[event.instance_id], input.name, received, time.perf_counter()))
+        self.dirty.add(event.instance_id)
+
+    def moving_mouse(self):
+        """Whether any controller has a stick in mouse mode that is moving the mouse."""
+        for controller in self.controllers.values():
+            if controller.mouse_sticks:
+                return True
+        return False
+
+    def get_timeout(self):
+        """Milliseconds until the engine has scheduled work to do."""
+        now = time.monotonic()
+        deadlines = []
+        if self.moving_mouse():
+            deadlines.append(self.next_mouse_move)
+        next_task = self.scheduler.next_time()
+        if next_task is not None:
+            deadlines.append(next_task)
+        if self.dirty:
+            deadlines.append(self.next_snapshot)
+        if not deadlines:
+            return self.idle_timeout
+        return max(1, min(self.idle_timeout, int((min(deadlines) - now) * 1000)))  # A timeout of 0 would wait forever
@@ -0,0 +1,75 @@
+import tkinter as tk
+
+BUTTON_WIDTH = 72
+BUTTON_HEIGHT = 22
+STICK_RADIUS = 30
+DOT_RADIUS = 5
+PADDING = 8
+COLUMNS = 6
+IDLE_COLOUR = "#e0e0e0"
+ACTIVE_COLOUR = "#4a90d9"
+
+class InputVisualizer:
+    """Draws the buttons, triggers, sticks and hats of a controller on a canvas.\n\n`render` compares a controller snapshot with what is
+    drawn and only changes the canvas items of inputs that changed, so an idle controller costs no drawing at all."""
+    def __init__(self, parent):
+        self.canvas = tk.Canvas(parent, height=2 * STICK_RADIUS + 3 * PADDING, highlightthickness=0)
+        self.buttons = {}       # Maps the names of buttons and triggers to their rectangle
+        self.dots = {}          # Maps the names of sticks and hats to their dot and the centre it moves around
+        self.held = set()       # The names of the buttons that are drawn as held
+        self.positions = {}     # Maps the names of sticks and hats to the pixel offset their dot is drawn at
+
+    def pack(self, **kwargs):
+        self.canvas.pack(**kwargs)
+
+    def set_inputs(self, inputs):
+        """Draw the inputs of a layout, as `(name, type, indices)` tuples. Replaces whatever was drawn before."""
+        self.canvas.delete("all")
+        self.buttons = {}
+        self.dots = {}
+        self.held = set()
+        self.positions = {}
+        buttons = [name for name, type, _ in inputs if type in ("button", "trigger")]
+        for i, name in enumerate(buttons):
+            x = PADDING + (i % COLUMNS) * (BUTTON_WIDTH + PADDING)
+            y = PADDING + (i // COLUMNS) * (BUTTON_HEIGHT + PADDING)
+            self.buttons[name] = self.canvas.create_rectangle(x, y, x + BUTTON_WIDTH, y + BUTTON_HEIGHT, fill=IDLE_COLOUR, outline="")
+            self.canvas.create_text(x + BUTTON_WIDTH / 2, y + BUTTON_HEIGHT / 2, text=name)
+
+        top = PADDING + -(-len(buttons) // COLUMNS) * (BUTTON_HEIGHT + PADDING)
+        pads = [(name, type) for name, type, _ in inputs if type in ("stick", "hat")]
+        for i, (name, type) in enumerate(pads):
+            cx = PADDING + STICK_RADIUS + i * (2 * STICK_RADIUS + 4 * PADDING)
+            cy = top + STICK_RADIUS
+            shape = self.canvas.create_oval if type == "stick" else self.canvas.create_rectangle
+            shape(cx - STICK_RADIUS, cy - STICK_RADIUS, cx + STICK_RADIUS, cy + STICK_RADIUS, outline="#909090")
+            self.canvas.create_text(cx, cy + STICK_RADIUS + PADDING, text=name)
+            dot = self.canvas.create_oval(cx - DOT_RADIUS, cy - DOT_RADIUS, cx + DOT_RADIUS, cy + DOT_RADIUS, fill=ACTIVE_COLOUR, outline="")
+            self.dots[name] = (dot, cx, cy)
+            self.positions[name] = (0, 0)
+        bottom = top + (2 * STICK_RADIUS + 3 * PADDING if pads else 0)
+        self.canvas.config(height=max(bottom, BUTTON_HEIGHT + 2 * PADDING))
+
+    def render(self, snapshot: dict):
+        """Update the drawing to a controller snapshot."""
+        held = set(snapshot["held"])
+        for name in held ^ self.held:
+            if name in self.buttons:
+                self.canvas.itemconfigure(self.buttons[name], fill=ACTIVE_COLOUR if name in held else IDLE_COLOUR)
+        self.held = held
+        for name, x, y, _ in snapshot["sticks"]:
+            self.move_dot(name, x, y)
+        for name, (x, y) in snapshot["hats"]:
+            self.move_dot(name, x, -y)     # Hats report up as a positive y
+
+    def move_dot(self, name: str, x: float, y: float):
+        """Move the dot of a stick or hat, if it moved at least a pixel."""
+        if name not in self.dots:
+            return
+        position = (round(x * STICK_RADIUS), round(y * STICK_RADIUS))
+        if position == self.positions[name]:
+            return
+        self.positions[name] = position
+        dot, cx, cy = self.dots[name]
+        dx, dy = cx + position[0], cy + position[1]
+        self.canvas.coords(dot, dx - DOT_RADIUS, dy - DOT_RADIUS, dx + DOT_RADIUS, dy + DOT_RADIUS)
@@ -1,14 +1,16 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import messagebox, ttk
+from VirtualController import compile_macro
 
 class KeyConfigWindow:
-    def __init__(self, root, keybind, entry):
+    def __init__(self, root, keybind, entry, engine=None):
         self.root = root
         self.root.title("Config")
         self.root.bind("<Destroy>", self.on_destroy)
         
         self.keybind = keybind
         self.entry = entry
+        self.engine = engine    # The input engine that owns the keybind. Edits are sent to its thread when set
         
         # Configure grid layout
         self.root.columnconfigure(0, weight=1)
@@ -49,11 +51,28 @@ class KeyConfigWindow:
         
         self.save_button = ttk.Button(self.buttons_frame, text="Save", command=self.save)
         self.save_button.pack(pady=10)
+        
+        # Turbo settings, used when the Turbo box of the keybind is checked
+        self.turbo_rate_var = tk.DoubleVar(value=keybind.turbo_rate)
+        self.turbo_duty_var = tk.DoubleVar(value=keybind.turbo_duty)
+        self.turbo_delay_var = tk.IntVar(value=int(keybind.turbo_delay * 1000))
+        ttk.Label(self.buttons_frame, text="Turbo presses/s").pack()
+        ttk.Spinbox(self.buttons_frame, from_=1, to=60, increment=1, width=8, textvariable=self.turbo_rate_var).pack(pady=2)
+        ttk.Label(self.buttons_frame, text="Turbo duty cycle").pack()
+        ttk.Spinbox(self.buttons_frame, from_=0.1, to=0.9, increment=0.1, width=8, textvariable=self.turbo_duty_var).pack(pady=2)
+        ttk.Label(self.buttons_frame, text="Turbo delay (ms)").pack()
+        ttk.Spinbox(self.buttons_frame, from_=0, to=2000, increment=50, width=8, textvariable=self.turbo_delay_var).pack(pady=2)
+
+        # A macro runs timed steps like "press ctrl; tap c; wait 100; release ctrl" instead of pressing all keys at once, see Macros.py
+        self.macro_var = tk.BooleanVar(value=keybind.macro is not None)
+        ttk.Checkbutton(self.buttons_frame, text="Macro", variable=self.macro_var).pack(pady=10)
 
         # Input text area
         self.input_text = tk.Text(self.root, height=10, wrap=tk.WORD)
         self.input_text.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=10, pady=5)
         
+        if keybind.macro:
+            self.input_text.insert(tk.END, keybind.macro.source)
         for key in keybind.bound_keys:
             output = ""
             if len(self.input_text.get("1.0", "end-1c")) != 0:
@@ -70,6 +89,8 @@ class KeyConfigWindow:
             return
         self.entry.config(state="normal")
         self.entry.delete(0, tk.END)
+        if self.keybind.macro:
+            self.entry.insert(tk.END, self.keybind.macro.source)
         for key in self.keybind.bound_keys:
             self.entry.insert(tk.END, key)
         self.entry.config(state="readonly")
@@ -98,6 +119,9 @@ class KeyConfigWindow:
             button.pack(pady=0)
             
     def insert_key(self, key):
+        if self.macro_var.get():
+            self.input_text.insert(tk.END, f"tap {key}; ")
+            return
         output = ""
         if len(self.input_text.get("1.0", "end-1c")) != 0:
             output += " + "
@@ -111,10 +135,34 @@ class KeyConfigWindow:
         self.root.bind_all("<KeyPress>", on_key_press)
         
     def save(self):
+        if self.macro_var.get():
+            # The macro is compiled once here, the engine thread only runs it
+            try:
+                macro = compile_macro(self.input_text.get("1.0", "end-1c"))
+            except ValueError as e:
+                messagebox.showerror("Macro", str(e), parent=self.root)
+                return
+            if self.engine:
+                self.engine.send(self.keybind.set_macro, macro).result()
+            else:
+                self.keybind.set_macro(macro)
+            return
         inputs = self.input_text.get("1.0", "end-1c")
         inputs = inputs.strip().replace("'", "")
         keys = inputs.split(" + ")
+        try:
+            turbo = (max(self.turbo_rate_var.get(), 1), min(max(self.turbo_duty_var.get(), 0.05), 0.95), max(self.turbo_delay_var.get(), 0) / 1000)
+        except tk.TclError:
+            messagebox.showerror("Turbo", "The turbo presses/s, duty cycle and delay must be numbers.", parent=self.root)
+            return
+        if self.engine:
+            self.engine.send(self.bind_keys, keys, turbo).result()
+        else:
+            self.bind_keys(keys, turbo)
+
+    def bind_keys(self, keys, turbo):
         self.keybind.clear_key()
         for key in keys:
             self.keybind.bind_key(key)
+        self.keybind.turbo_rate, self.keybind.turbo_duty, self.keybind.turbo_delay = turbo
         
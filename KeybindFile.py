@@ -0,0 +1,175 @@
+import mmap
+import os
+import struct
+
+# The binary keybindings file. It holds the same data as keybindings.json, which can still be imported and exported, but every string
+# is stored once in a string table and the layouts are indexed, so opening a file only reads the index and a layout is decoded the
+# first time it is used.
+#
+#   header    magic, format version, flags, offset of the string table, offset of the index
+#   values    the keybindings of every layout, one after the other
+#   strings   the amount of strings, then the utf-8 length and bytes of every string
+#   index     the amount of layouts, then the controller name, layout name and value offset of every layout
+#
+# Numbers in the values, strings and index are varints. A value starts with its type, followed by a number, a float, a string number,
+# or the amount of items and the items of a list or dictionary.
+MAGIC = b"MSKB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+FLOAT = struct.Struct("<d")
+NONE, FALSE, TRUE, INT, NUMBER, STRING, LIST, DICT = range(8)
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(buffer, position: int):
+    """Return the varint at `position` and the position after it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+class Encoder:
+    """Encodes keybindings into values that share one string table."""
+    def __init__(self):
+        self.out = bytearray(HEADER.size)
+        self.strings = {}       # Maps every string to its number in the string table
+
+    def string(self, string: str):
+        return self.strings.setdefault(string, len(self.strings))
+
+    def value(self, value):
+        out = self.out
+        if value is None:
+            out.append(NONE)
+        elif value is True or value is False:
+            out.append(TRUE if value else FALSE)
+        elif isinstance(value, int):
+            out.append(INT)
+            write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)   # Zigzag, so small negative numbers stay small
+        elif isinstance(value, float):
+            out.append(NUMBER)
+            out += FLOAT.pack(value)
+        elif isinstance(value, str):
+            out.append(STRING)
+            write_varint(out, self.string(value))
+        elif isinstance(value, (list, tuple)):
+            out.append(LIST)
+            write_varint(out, len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, dict):
+            out.append(DICT)
+            write_varint(out, len(value))
+            for key, item in value.items():
+                write_varint(out, self.string(key))
+                self.value(item)
+        else:
+            raise TypeError(f"can't save a {type(value).__name__} in a keybindings file")
+
+def encode(layouts: dict):
+    """Encode a dictionary that maps controller names to dictionaries that map layout names to keybindings."""
+    encoder = Encoder()
+    index = []
+    for controller_name, controller_layouts in layouts.items():
+        for layout_name, keybindings in controller_layouts.items():
+            index.append((encoder.string(controller_name), encoder.string(layout_name), len(encoder.out)))
+            encoder.value(keybindings)
+    out = encoder.out
+    strings_offset = len(out)
+    write_varint(out, len(encoder.strings))
+    for string in encoder.strings:
+        data = string.encode()
+        write_varint(out, len(data))
+        out += data
+    index_offset = len(out)
+    write_varint(out, len(index))
+    for entry in index:
+        for number in entry:
+            write_varint(out, number)
+    HEADER.pack_into(out, 0, MAGIC, VERSION, 0, strings_offset, index_offset)
+    return bytes(out)
+
+class KeybindReader:
+    """Reads a binary keybindings file through a memory map.\n\nOpening the file only reads the string table and the index, `read`
+    decodes the keybindings of a single layout. Raises a `ValueError` if the file isn't a keybindings file this version can read."""
+    def __init__(self, filename: str):
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise ValueError(f"{filename} is not a keybindings file")
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, strings_offset, index_offset = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a keybindings file")
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"{filename} was saved by a newer version of Mist Input (format {version})")
+        buffer = self.buffer
+        count, position = read_varint(buffer, strings_offset)
+        self.strings = []
+        for _ in range(count):
+            length, position = read_varint(buffer, position)
+            self.strings.append(buffer[position:position + length].decode())
+            position += length
+        self.index = {}         # Maps controller names to dictionaries that map layout names to the offset of their keybindings
+        count, position = read_varint(buffer, index_offset)
+        for _ in range(count):
+            controller, position = read_varint(buffer, position)
+            layout, position = read_varint(buffer, position)
+            offset, position = read_varint(buffer, position)
+            self.index.setdefault(self.strings[controller], {})[self.strings[layout]] = offset
+
+    def read(self, offset: int):
+        """Decode the keybindings at an offset of the index."""
+        return self.value(offset)[0]
+
+    def value(self, position: int):
+        """Decode the value at `position` and return it and the position after it."""
+        buffer = self.buffer
+        strings = self.strings
+        type = buffer[position]
+        if type == NUMBER:
+            return FLOAT.unpack_from(buffer, position + 1)[0], position + 1 + FLOAT.size
+        if type < INT:
+            return (None, False, True)[type], position + 1
+        # Almost every number in a keybindings file fits in one byte, so those are read without calling read_varint
+        number = buffer[position + 1]
+        position += 2
+        if number >= 0x80:
+            number, position = read_varint(buffer, position - 1)
+        if type == STRING:
+            return strings[number], position
+        if type == LIST:
+            items = []
+            for _ in range(number):
+                if buffer[position] == STRING and buffer[position + 1] < 0x80:
+                    items.append(strings[buffer[position + 1]])
+                    position += 2
+                else:
+                    item, position = self.value(position)
+                    items.append(item)
+            return items, position
+        if type == DICT:
+            items = {}
+            for _ in range(number):
+                key = buffer[position]
+                position += 1
+                if key >= 0x80:
+                    key, position = read_varint(buffer, position - 1)
+                items[strings[key]], position = self.value(position)
+            return items, position
+        if type == INT:
+            return (number >> 1) ^ -(number & 1), position
+        raise ValueError(f"unknown value type {type} at {position - 2}")
+
+    def close(self):
+        self.buffer.close()
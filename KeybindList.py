@@ -0,0 +1,178 @@
+import tkinter as tk
+from tkinter import ttk
+from KeyConfigWindow import KeyConfigWindow
+from VirtualController import CURVES
+
+# Shown in the curve picker for a stick whose saved curve is a lookup table, which can't be picked or edited in the row
+TABLE_CURVE = "lookup table"
+
+def key_names(keys):
+    """Return the bound keys of a keybind as they are shown in a row."""
+    return " + ".join(keys)
+
+class KeybindRow:
+    """A row of the Keybinds tab. It shows either the keybind of an input or the mouse settings of a stick, and can be moved to
+    another keybind or stick with `show` without creating any widgets."""
+    def __init__(self, parent, app):
+        self.app = app
+        self.item = None        # The ("keybind", name, keybind) or ("mouse", name, axis) the row shows
+        self.frame = ttk.Frame(parent)
+        self.label = ttk.Label(self.frame, width=15)
+        self.label.pack(side=tk.LEFT)
+
+        # Keybind widgets
+        self.keybind_frame = ttk.Frame(self.frame)
+        self.entry = ttk.Entry(self.keybind_frame, width=15, state="readonly", justify="center")
+        self.entry.pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.keybind_frame, text="Bind", command=self.start_listening).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.keybind_frame, text="Clear", command=self.clear_binding).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.keybind_frame, text="Edit", command=self.open_advanced_keybind_window).pack(side=tk.LEFT, padx=5)
+        self.while_pressed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.keybind_frame, text="Turbo", variable=self.while_pressed_var, command=self.toggle_while_pressed).pack(side=tk.LEFT, padx=5)
+
+        # Mouse mode widgets, to move the mouse with a stick instead of using its direction keybinds
+        self.mouse_frame = ttk.Frame(self.frame)
+        self.mouse_mode_var = tk.BooleanVar(value=False)
+        self.speed_var = tk.IntVar(value=1000)
+        self.curve_var = tk.StringVar(value="linear")
+        ttk.Checkbutton(self.mouse_frame, text="Move mouse", variable=self.mouse_mode_var, command=self.update_mouse_mode).pack(side=tk.LEFT, padx=5)
+        ttk.Scale(self.mouse_frame, from_=100, to=3000, variable=self.speed_var, command=lambda value: self.update_mouse_mode()).pack(side=tk.LEFT, padx=5)
+        curve_picker = ttk.Combobox(self.mouse_frame, values=list(CURVES), textvariable=self.curve_var, state="readonly", width=12)
+        curve_picker.pack(side=tk.LEFT, padx=5)
+        curve_picker.bind("<<ComboboxSelected>>", self.update_mouse_mode)
+
+    def show(self, item, row: int):
+        """Show a keybind or the mouse settings of a stick in the given grid row."""
+        kind, name, target = item
+        if self.item is None or self.item[0] != kind:
+            (self.mouse_frame if kind == "keybind" else self.keybind_frame).pack_forget()
+            (self.keybind_frame if kind == "keybind" else self.mouse_frame).pack(side=tk.LEFT)
+        self.item = item
+        self.label.config(text=name)
+        if kind == "keybind":
+            self.set_entry(target.macro.source if target.macro else key_names(target.bound_keys))
+            self.while_pressed_var.set(target.while_pressed)
+        else:
+            self.mouse_mode_var.set(target.mouse_mode)
+            self.speed_var.set(target.mouse_speed)
+            self.curve_var.set(target.curve if type(target.curve) == str else TABLE_CURVE)
+        self.frame.grid(row=row, column=0, sticky="ew", padx=10, pady=2)
+
+    def hide(self):
+        self.frame.grid_remove()
+
+    def set_entry(self, text: str):
+        self.entry.config(state="normal")
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, text)
+        self.entry.config(state="readonly")
+
+    def start_listening(self):
+        keybind = self.item[2]      # The row may show another keybind by the time a key is pressed
+        def on_key_press(event):
+            self.app.engine.send(keybind.bind_key, event.keysym)
+            if self.item[2] is keybind:
+                self.set_entry(event.keysym)
+            self.app.root.unbind_all("<KeyPress>")
+        self.set_entry("...")
+        self.app.root.bind_all("<KeyPress>", on_key_press)
+
+    def clear_binding(self):
+        self.set_entry("")
+        self.app.engine.send(self.item[2].clear_key)
+
+    def open_advanced_keybind_window(self):
+        adv_window = tk.Toplevel(self.app.root)
+        adv_window.grab_set()
+        adv_window.transient(self.app.root)
+        KeyConfigWindow(adv_window, self.item[2], self.entry, self.app.engine)
+
+    def toggle_while_pressed(self):
+        self.app.engine.send(setattr, self.item[2], "while_pressed", self.while_pressed_var.get())
+
+    def update_mouse_mode(self, *args):
+        # A curve that isn't one of the picker's values is kept as it is
+        curve = self.curve_var.get()
+        self.app.engine.send(self.item[2].set_mouse_mode, self.mouse_mode_var.get(), self.speed_var.get(), curve if curve in CURVES else None)
+
+class KeybindList:
+    """The rows of the Keybinds tab.\n\nOnly the rows that fit in the tab are created, and scrolling or selecting another controller only
+    changes what those rows show. So a layout with hundreds of inputs builds as fast as a small one, and selecting controllers over and
+    over doesn't create any widgets."""
+    def __init__(self, parent, app):
+        self.app = app              # The ControllerMapperApp, for its root window and input engine
+        # The frame keeps its own size instead of growing with its rows, so the window doesn't resize while scrolling
+        self.frame = ttk.Frame(parent, width=620, height=400)
+        self.frame.grid_propagate(False)
+        self.frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.frame.columnconfigure(0, weight=1)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.items = []             # ("keybind", name, keybind) and ("mouse", name, axis) for every row of the controller
+        self.rows = []              # The created rows, reused for every controller
+        self.first = 0              # Index of the item shown in the first row
+        self.row_height = None
+        self.frame.bind("<Configure>", lambda event: self.refresh())
+        # Every widget of the main window gets the bindings of the window, so this sees the mouse wheel over any row
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.frame.winfo_toplevel().bind(sequence, self.on_mousewheel, add="+")
+
+    def set_controller(self, controller):
+        """Show the keybinds of a controller, or nothing if it is None."""
+        self.items = []
+        if controller:
+            for name, input in controller.inputs.items():
+                if isinstance(input.keybind, dict):
+                    self.items.extend(("keybind", f"{name} {direction}", keybind) for direction, keybind in input.keybind.items())
+                    if isinstance(input, controller.Axis):
+                        self.items.append(("mouse", f"{name} mouse", input))
+                else:
+                    self.items.append(("keybind", name, input.keybind))
+        self.first = 0
+        self.refresh()
+
+    def visible_count(self):
+        """The amount of rows that fit in the tab."""
+        height = self.frame.winfo_height()
+        if height <= 1:     # Not shown yet, the rows are created when the tab is shown
+            return 0
+        if self.row_height is None:
+            if not self.items:
+                return 0
+            self.rows.append(KeybindRow(self.frame, self.app))
+            self.rows[0].show(self.items[0], 0)
+            self.frame.update_idletasks()
+            self.row_height = self.rows[0].frame.winfo_reqheight() + 4
+        return max(1, height // self.row_height)
+
+    def refresh(self):
+        """Show the items that are scrolled into view in the rows, creating rows only when more fit than were created before."""
+        count = min(self.visible_count(), len(self.items))
+        self.first = max(0, min(self.first, len(self.items) - count))
+        while len(self.rows) < count:
+            self.rows.append(KeybindRow(self.frame, self.app))
+        for i, row in enumerate(self.rows):
+            if i < count:
+                row.show(self.items[self.first + i], i)
+            else:
+                row.hide()
+        if self.items:
+            self.scrollbar.set(self.first / len(self.items), (self.first + count) / len(self.items))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_scroll(self, action: str, amount, unit: str=None):
+        """Scroll with the scrollbar, which calls this with "moveto" and a fraction or "scroll" and an amount of units or pages."""
+        if action == "moveto":
+            self.first = int(float(amount) * len(self.items))
+        elif action == "scroll":
+            self.first += int(amount) * (max(1, len(self.rows) - 1) if unit == "pages" else 1)
+        self.refresh()
+
+    def on_mousewheel(self, event):
+        if not str(event.widget).startswith(str(self.frame)):
+            return
+        if event.num == 4 or event.delta > 0:
+            self.on_scroll("scroll", -1)
+        else:
+            self.on_scroll("scroll", 1)
@@ -0,0 +1,176 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+from KeybindFile import KeybindReader, encode
+
+DEFAULT_FILE = "keybindings.bin"
+
+class KeybindStore:
+    """Keeps the keybindings file in memory, indexed by controller name and layout name.\n\nThe file is read once and only read again when its
+    modification time or size changes. Writes update the memory right away and are written to disk after `write_delay` seconds, so saving
+    several layouts in a row writes the file once. The file is replaced atomically, so a crash never leaves half a file behind.
+
+    Files that end in .json are read and written as json. Other files use the binary format of KeybindFile, where only the index is read
+    when the file is opened and every layout is decoded the first time it is used. A binary file that doesn't exist yet is created from
+    the json file with the same name, so keybindings saved by older versions carry over."""
+    def __init__(self, filename: str=DEFAULT_FILE, write_delay: float=0.5):
+        self.filename = filename
+        self.write_delay = write_delay
+        self.binary = not filename.endswith(".json")
+        self.layouts = {}       # Maps controller names to dictionaries that map layout names to keybindings
+        self.reader = None      # The KeybindReader of a binary file. Layouts it hasn't decoded yet are None in `layouts`
+        self.file_state = False # (mtime, size) of the file when it was last read or written, None if there was no file and False before the first read
+        self.dirty = False      # Whether there are changes that haven't been written yet
+        self.timer = None
+        self.lock = threading.RLock()
+
+    def refresh(self):
+        """Read the file again if it changed on disk. Unwritten changes are kept.\n\nA file that can't be read raises the error, and is
+        read again the next time instead of being remembered as read."""
+        try:
+            stat = os.stat(self.filename)
+            file_state = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_state = None
+        if file_state == self.file_state or self.dirty:
+            return
+        if file_state is None:
+            self.file_state = file_state
+            self.close_reader()
+            self.layouts = {}
+            if self.binary:
+                self.migrate()
+            return
+        if self.binary:
+            reader = KeybindReader(self.filename)
+            layouts = {controller_name: dict.fromkeys(layouts) for controller_name, layouts in reader.index.items()}
+        else:
+            reader = None
+            with open(self.filename, "r") as f:
+                layouts = json.load(f)
+        self.close_reader()
+        self.reader = reader
+        self.layouts = layouts
+        self.file_state = file_state
+
+    def migrate(self):
+        """Create a missing binary file from the json file with the same name, if there is one."""
+        legacy_filename = os.path.splitext(self.filename)[0] + ".json"
+        if not os.path.exists(legacy_filename):
+            return
+        self.import_json(legacy_filename)
+        self.flush()
+
+    def close_reader(self):
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+
+    def decode(self, controller_name: str, layout_name: str):
+        """Return the keybindings of a layout, decoding them from the binary file the first time."""
+        layouts = self.layouts.get(controller_name, {})
+        keybindings = layouts.get(layout_name)
+        if keybindings is None and layout_name in layouts and self.reader:
+            keybindings = layouts[layout_name] = self.reader.read(self.reader.index[controller_name][layout_name])
+        return keybindings
+
+    def layout_names(self, controller_name: str):
+        """Return the names of every layout saved for a controller, or None if the controller has none."""
+        with self.lock:
+            self.refresh()
+            if controller_name in self.layouts:
+                return list(self.layouts[controller_name])
+
+    def get(self, controller_name: str, layout_name: str):
+        """Return the keybindings of a layout, or None if it doesn't exist. The result must not be changed."""
+        with self.lock:
+            self.refresh()
+            return self.decode(controller_name, layout_name)
+
+    def put(self, controller_name: str, layout_name: str, keybindings: dict):
+        """Save the keybindings of a layout. The file is written after `write_delay` seconds."""
+        with self.lock:
+            self.refresh()
+            self.layouts.setdefault(controller_name, {})[layout_name] = keybindings
+            self.dirty = True
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.write_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def import_json(self, filename: str):
+        """Add every layout of a json keybindings file, replacing the layouts with the same names. Written like `put`."""
+        with open(filename, "r") as f:
+            layouts = json.load(f)
+        with self.lock:
+            for controller_name, controller_layouts in layouts.items():
+                for layout_name, keybindings in controller_layouts.items():
+                    self.put(controller_name, layout_name, keybindings)
+
+    def export_json(self, filename: str):
+        """Write every layout to a json keybindings file."""
+        with self.lock:
+            self.refresh()
+            layouts = {controller_name: {layout_name: self.decode(controller_name, layout_name) for layout_name in controller_layouts}
+                       for controller_name, controller_layouts in self.layouts.items()}
+        with open(filename, "w") as f:
+            json.dump(layouts, f, indent=2)
+
+    def flush(self):
+        """Write unwritten changes to the file right away."""
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            if self.binary:
+                # Decode what is still only in the old file, which is closed before it is replaced
+                for controller_name, controller_layouts in self.layouts.items():
+                    for layout_name in controller_layouts:
+                        self.decode(controller_name, layout_name)
+                self.close_reader()
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, temp_filename = tempfile.mkstemp(dir=directory, prefix=".keybindings-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb" if self.binary else "w") as f:
+                    # mkstemp makes the file readable by its owner only, so it gets the mode of the file it replaces
+                    os.chmod(temp_filename, file_mode(self.filename))
+                    if self.binary:
+                        f.write(encode(self.layouts))
+                    else:
+                        json.dump(self.layouts, f, separators=(",", ":"))
+                os.replace(temp_filename, self.filename)
+            except BaseException:
+                os.remove(temp_filename)
+                raise
+            stat = os.stat(self.filename)
+            self.file_state = (stat.st_mtime_ns, stat.st_size)
+            self.dirty = False
+
+def file_mode(filename: str):
+    """Return the permissions of a file, or the permissions the umask gives a new file if it doesn't exist."""
+    try:
+        return os.stat(filename).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+stores = {}
+
+def get_store(filename: str=DEFAULT_FILE):
+    """Return the shared store of a keybindings file."""
+    path = os.path.abspath(filename)
+    if path not in stores:
+        stores[path] = KeybindStore(filename)
+    return stores[path]
+
+@atexit.register
+def flush_all():
+    """Write the changes of every store before the program exits."""
+    for store in stores.values():
+        store.flush()
@@ -0,0 +1,85 @@
+from array import array
+
+# The latency stages that are measured, in the order they happen
+STAGES = ("map", "inject", "total")
+# The upper bounds in seconds of the histogram buckets of the report
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+class LatencyRing:
+    """A fixed-size ring buffer of latencies in seconds.\n\nOnly the engine thread writes to it. Other threads read a copy with `values`,
+    so no lock is needed and recording never allocates."""
+    __slots__ = ("values_buffer", "index", "count")
+    def __init__(self, size: int):
+        self.values_buffer = array("d", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.values_buffer[self.index] = value
+        self.index = (self.index + 1) % len(self.values_buffer)
+        self.count += 1
+
+    def values(self):
+        """Return a copy of the recorded values, oldest first."""
+        if self.count < len(self.values_buffer):
+            return self.values_buffer[:self.count].tolist()
+        return (self.values_buffer[self.index:] + self.values_buffer[:self.index]).tolist()
+
+def percentile(values, fraction: float):
+    """Return the value below which `fraction` of the sorted values fall."""
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+class LatencyStats:
+    """Keeps the latency from a controller event to the injected input, per input.\n\nThe engine records three timestamps for every
+    event: when it was received, after the controller updated its state and queued the keybind actions, and after the backend was flushed.
+    Those become the "map", "inject" and "total" latencies."""
+    def __init__(self, size: int=1024):
+        self.size = size        # The amount of latencies kept per input and stage
+        self.rings = {}         # Maps input names to a dictionary of LatencyRing objects per stage
+
+    def record(self, name: str, received: float, mapped: float, injected: float):
+        """Record the timestamps of a single event. Timestamps are time.perf_counter() values."""
+        rings = self.rings.get(name)
+        if rings is None:
+            rings = self.rings[name] = {stage: LatencyRing(self.size) for stage in STAGES}
+        rings["map"].add(mapped - received)
+        rings["inject"].add(injected - mapped)
+        rings["total"].add(injected - received)
+
+    def percentiles(self, name: str, stage: str="total"):
+        """Return the event count and the p50, p95 and p99 latency in seconds of an input."""
+        ring = self.rings[name][stage]
+        values = sorted(ring.values())
+        return ring.count, percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)
+
+    def histogram(self, name: str, stage: str="total", buckets=BUCKETS):
+        """Return how many of the kept latencies of an input fall in each bucket. The last count is for everything above the last bucket."""
+        counts = [0] * (len(buckets) + 1)
+        for value in self.rings[name][stage].values():
+            for i, bucket in enumerate(buckets):
+                if value <= bucket:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    def report(self, stage: str="total"):
+        """Return a text table with the latency percentiles of every input in milliseconds, followed by a histogram of the kept
+        latencies of every input."""
+        names = sorted(dict(self.rings))    # The engine thread adds inputs while the report is made on another thread
+        lines = [f"{'input':<15}{'events':>8}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        if not names:
+            lines.append("No input received yet.")
+            return "\n".join(lines)
+        for name in names:
+            count, p50, p95, p99 = self.percentiles(name, stage)
+            lines.append(f"{name:<15}{count:>8}{p50 * 1000:>9.3f}{p95 * 1000:>9.3f}{p99 * 1000:>9.3f}")
+        labels = [f"<={bucket * 1000:g}" for bucket in BUCKETS] + [f">{BUCKETS[-1] * 1000:g}"]
+        lines.append("")
+        lines.append(f"{'input':<15}" + "".join(f"{label:>8}" for label in labels))
+        for name in names:
+            lines.append(f"{name:<15}" + "".join(f"{count:>8}" for count in self.histogram(name, stage)))
+        return "\n".join(lines)
@@ -0,0 +1,84 @@
+
+# A macro is a list of steps separated by ";" or new lines, compiled with VirtualController.compile_macro:
+#
+#   press KEY       hold a key or mouse button down, KEY is a name like the "Bind" button and the config window use, such as "ctrl" or "m_left"
+#   release KEY     let a key or mouse button go
+#   tap KEY         press and release a key or mouse button
+#   wait MS         wait a number of milliseconds
+#   type TEXT       tap every character of the text
+#   move DX DY      move the mouse by DX, DY pixels
+#   scroll DX DY    scroll the mouse wheel by DX, DY steps
+#   repeat [N]      run the whole macro N times, or until the button is released without N. Can only be the last step
+#
+# For example "press ctrl; tap c; release ctrl; wait 100; press ctrl; tap v; release ctrl" copies and pastes.
+
+class Macro:
+    """A compiled macro.\n\nThe steps are grouped into frames: the steps between two waits run together, and each frame runs a delay
+    after the frame before it. Macros don't change once compiled, so one macro can run on several keybinds at once."""
+    __slots__ = ("source", "frames", "repeat")
+    def __init__(self, source: str, frames, repeat: int=1):
+        self.source = source        # The text the macro was compiled from, which is what gets saved
+        self.frames = frames        # (delay, steps) tuples. Each step is an (action, down) pair. down is True to press the action, False to release it and None for movements
+        self.repeat = repeat        # How many times the macro runs. 0 repeats it until the run is cancelled
+
+    def start(self, backend, scheduler):
+        """Start running the macro on a backend and return the `MacroRun`."""
+        return MacroRun(self, backend, scheduler)
+
+    def __repr__(self):
+        return f"Macro({self.source!r})"
+
+class MacroRun:
+    """A running macro. Every frame is a task on the scheduler, so any amount of macros run at once on the thread that runs the
+    scheduler, without a thread per macro. Frames are scheduled from the time the frame before them was due, so waits don't drift."""
+    __slots__ = ("macro", "backend", "scheduler", "index", "runs", "due", "task", "held")
+    def __init__(self, macro: Macro, backend, scheduler):
+        self.macro = macro
+        self.backend = backend
+        self.scheduler = scheduler
+        self.index = 0              # The next frame to run
+        self.runs = 0               # How many times the whole macro ran
+        self.due = scheduler.clock() + macro.frames[0][0]  # The scheduler time the next frame is due
+        self.task = None
+        self.held = set()           # The actions the macro pressed and didn't release yet
+        if macro.frames[0][0] > 0:
+            self.task = scheduler.schedule_at(self.due, self.advance)
+        else:
+            self.advance()
+
+    def advance(self):
+        """Run the frames that are due and schedule the next one. Run by the scheduler."""
+        self.task = None
+        frames = self.macro.frames
+        while True:
+            for action, down in frames[self.index][1]:
+                if down is None:
+                    action.press(self.backend)
+                elif down:
+                    # Pressing a key the macro already holds does nothing, so a single release always lets it go
+                    if action not in self.held:
+                        action.press(self.backend)
+                        self.held.add(action)
+                elif action in self.held:
+                    action.release(self.backend)
+                    self.held.discard(action)
+            self.index += 1
+            if self.index == len(frames):
+                self.runs += 1
+                if self.macro.repeat and self.runs >= self.macro.repeat:
+                    return
+                self.index = 0
+            delay = frames[self.index][0]
+            if delay > 0:
+                self.due += delay
+                self.task = self.scheduler.schedule_at(self.due, self.advance)
+                return
+
+    def cancel(self):
+        """Stop the macro and release whatever it still holds."""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for action in self.held:
+            action.release(self.backend)
+        self.held.clear()
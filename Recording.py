@@ -0,0 +1,163 @@
+import struct
+import time
+
+MAGIC = b"MIST"
+VERSION = 2                         # Version 2 added the GUID, version 1 recordings still load without one
+HEADER = struct.Struct("<4sBH")     # Magic, version, length of the controller name
+GUID = struct.Struct("<B")          # Length of the controller GUID, after the name
+COUNTS = struct.Struct("<HHH")      # Amount of buttons, axes and hats
+TIME = struct.Struct("<d")
+
+class Recording:
+    """A timestamped stream of raw joystick states.\n\nEach frame is a `(time, buttons, axes, hats)` tuple with the time in seconds since
+    the recording started, a tuple of button states, a tuple of axis values and a tuple of `(x, y)` hat values.
+    On disk every frame is stored as a double, a bit per button, a signed 16 bit integer per axis and two signed bytes per hat."""
+    def __init__(self, name: str, numbuttons: int, numaxes: int, numhats: int=0, guid: str=""):
+        self.name = name
+        self.guid = guid
+        self.numbuttons = numbuttons
+        self.numaxes = numaxes
+        self.numhats = numhats
+        self.frames = []
+        self.frame = struct.Struct(f"<{(numbuttons + 7) // 8}s{numaxes}h{numhats * 2}b")
+
+    def add_frame(self, time: float, buttons, axes, hats=()):
+        self.frames.append((time, tuple(buttons), tuple(axes), tuple(hats)))
+
+    def duration(self):
+        return self.frames[-1][0] if self.frames else 0.0
+
+    def save(self, filename: str):
+        name = self.name.encode()
+        guid = (self.guid or "").encode()
+        with open(filename, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(name)))
+            f.write(name)
+            f.write(GUID.pack(len(guid)))
+            f.write(guid)
+            f.write(COUNTS.pack(self.numbuttons, self.numaxes, self.numhats))
+            for frame_time, buttons, axes, hats in self.frames:
+                bits = bytearray((self.numbuttons + 7) // 8)
+                for i, pressed in enumerate(buttons):
+                    if pressed:
+                        bits[i // 8] |= 1 << (i % 8)
+                values = [round(max(-1.0, min(1.0, value)) * 32767) for value in axes]
+                values += [value for hat in hats for value in hat]
+                f.write(TIME.pack(frame_time))
+                f.write(self.frame.pack(bytes(bits), *values))
+
+    @classmethod
+    def load(cls, filename: str):
+        """Load a recording saved with `save`. Raises a `ValueError` if the file isn't a recording."""
+        with open(filename, "rb") as f:
+            data = f.read()
+        magic, version, name_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{filename} is not a Mist Input recording.")
+        offset = HEADER.size
+        name = data[offset:offset + name_length].decode()
+        offset += name_length
+        guid = ""
+        if version >= 2:
+            guid_length = GUID.unpack_from(data, offset)[0]
+            offset += GUID.size
+            guid = data[offset:offset + guid_length].decode()
+            offset += guid_length
+        recording = cls(name, *COUNTS.unpack_from(data, offset), guid=guid)
+        offset += COUNTS.size
+        while offset < len(data):
+            frame_time = TIME.unpack_from(data, offset)[0]
+            bits, *values = recording.frame.unpack_from(data, offset + TIME.size)
+            offset += TIME.size + recording.frame.size
+            buttons = [bits[i // 8] >> (i % 8) & 1 for i in range(recording.numbuttons)]
+            axes = [value / 32767 for value in values[:recording.numaxes]]
+            hat_values = values[recording.numaxes:]
+            hats = [(hat_values[i], hat_values[i + 1]) for i in range(0, len(hat_values), 2)]
+            recording.add_frame(frame_time, buttons, axes, hats)
+        return recording
+
+class Recorder:
+    """Records the raw state of a joystick every time `capture` is called and the state changed."""
+    def __init__(self, joystick):
+        self.joystick = joystick
+        guid = joystick.get_guid() if hasattr(joystick, "get_guid") else ""
+        self.recording = Recording(joystick.get_name(), joystick.get_numbuttons(), joystick.get_numaxes(), joystick.get_numhats(), guid)
+        self.start_time = None
+        self.last_state = None
+
+    def capture(self, now: float=None):
+        """Add a frame with the current state of the joystick if it changed since the last frame."""
+        if now is None:
+            now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        joystick = self.joystick
+        state = (
+            tuple(joystick.get_button(i) for i in range(self.recording.numbuttons)),
+            tuple(joystick.get_axis(i) for i in range(self.recording.numaxes)),
+            tuple(joystick.get_hat(i) for i in range(self.recording.numhats)),
+        )
+        if state != self.last_state:
+            self.last_state = state
+            self.recording.add_frame(now - self.start_time, *state)
+
+class ReplayJoystick:
+    """Stands in for a `pygame.joystick.Joystick` and reports the state of a recording frame.\n\nMove through the recording with `set_frame` or
+    `seek`. `clock` returns the time `seek` moved to, so a `Scheduler` given it as its clock runs on the time of the recording."""
+    def __init__(self, recording: Recording, instance_id: int=-1):
+        self.recording = recording
+        self.instance_id = instance_id
+        self.index = 0
+        self.time = 0.0             # The time of the recording the replay is at, in seconds
+        self.buttons, self.axes, self.hats = (0,) * recording.numbuttons, (0.0,) * recording.numaxes, ((0, 0),) * recording.numhats
+        if recording.frames:
+            self.set_frame(0)
+
+    def set_frame(self, index: int):
+        self.index = index
+        _, self.buttons, self.axes, self.hats = self.recording.frames[index]
+
+    def seek(self, time: float):
+        """Move to the last frame recorded at or before `time`."""
+        self.time = time
+        frames = self.recording.frames
+        index = self.index if frames[self.index][0] <= time else 0
+        while index + 1 < len(frames) and frames[index + 1][0] <= time:
+            index += 1
+        self.set_frame(index)
+
+    def clock(self):
+        return self.time
+
+    def init(self):
+        pass
+
+    def get_init(self):
+        return True
+
+    def get_name(self):
+        return self.recording.name
+
+    def get_guid(self):
+        return self.recording.guid
+
+    def get_instance_id(self):
+        return self.instance_id
+
+    def get_numbuttons(self):
+        return self.recording.numbuttons
+
+    def get_numaxes(self):
+        return self.recording.numaxes
+
+    def get_numhats(self):
+        return self.recording.numhats
+
+    def get_button(self, i: int):
+        return self.buttons[i]
+
+    def get_axis(self, i: int):
+        return self.axes[i]
+
+    def get_hat(self, i: int):
+        return self.hats[i]
@@ -0,0 +1,67 @@
+import heapq
+import time
+
+class Task:
+    """A callback scheduled to run at a point in time. Returned by `Scheduler.schedule` so it can be cancelled."""
+    __slots__ = ("time", "order", "callback", "cancelled")
+    def __init__(self, time: float, order: int, callback):
+        self.time = time            # The time of the scheduler's clock the callback is due
+        self.order = order          # Keeps tasks that are due at the same time in the order they were scheduled
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return (self.time, self.order) < (other.time, other.order)
+
+class Scheduler:
+    """Runs callbacks at monotonic times from a single thread.\n\nTasks are kept in a heap keyed on their due time, so only scheduled
+    tasks cost anything and finding the next one is constant time. The scheduler isn't thread safe; it is meant to be run by the thread
+    that schedules on it, such as the input engine thread.
+
+    The clock is time.monotonic unless another one is given. The controllers and macros that use the scheduler read the time from its
+    clock too, so a replay can drive all of them from the timestamps of a recording."""
+    def __init__(self, clock=time.monotonic):
+        self.tasks = []
+        self.count = 0
+        self.clock = clock          # Returns the current time in seconds
+
+    def schedule(self, delay: float, callback):
+        """Run `callback()` after `delay` seconds. Returns the `Task`."""
+        self.count += 1
+        task = Task(self.clock() + delay, self.count, callback)
+        heapq.heappush(self.tasks, task)
+        return task
+
+    def schedule_at(self, due: float, callback):
+        """Run `callback()` at a time of the scheduler's clock. Returns the `Task`.\n\nScheduling every step of a sequence from the time the
+        last step was due, instead of from when it ran, keeps the sequence from drifting when the scheduler runs late."""
+        self.count += 1
+        task = Task(due, self.count, callback)
+        heapq.heappush(self.tasks, task)
+        return task
+
+    def next_time(self):
+        """Return the time the next task is due, or None when nothing is scheduled."""
+        while self.tasks and self.tasks[0].cancelled:
+            heapq.heappop(self.tasks)
+        return self.tasks[0].time if self.tasks else None
+
+    def run_due(self, now: float=None):
+        """Run every task that is due. Tasks scheduled by the callbacks run on a later call.\n\nA callback that raises is reported and the
+        other due tasks still run."""
+        if now is None:
+            now = self.clock()
+        due = []
+        while self.tasks and self.tasks[0].time <= now:
+            task = heapq.heappop(self.tasks)
+            if not task.cancelled:
+                due.append(task)
+        for task in due:
+            if not task.cancelled:
+                try:
+                    task.callback()
+                except Exception as e:
+                    print(f"Error running scheduled task {task.callback}: {e}")
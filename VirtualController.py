@@ -1,110 +1,464 @@
-import pygame
-from pynput.keyboard import Controller as KeyboardController, Key
-from pynput.mouse import Controller as MouseController, Button
+from Backends import Backend, get_default_backend
+from Calibration import Calibration, read_calibration, write_calibration
 from ControllerLayouts import GetControllerLayout
-import json
+from Filters import FilterPipeline
+from KeybindStore import get_store
+from Macros import Macro
+from Scheduler import Scheduler
+import math
+from array import array
+
+class Action:
+    """Base class for the actions a keybind compiles its bound keys into."""
+    __slots__ = ()
+    def press(self, backend: Backend):
+        pass
+
+    def release(self, backend: Backend):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(repr(getattr(self, name)) for name in self.__slots__)})"
+
+class KeyAction(Action):
+    """Presses and releases a keyboard key."""
+    __slots__ = ("key",)
+    def __init__(self, key):
+        self.key = key
+
+    def press(self, backend: Backend):
+        backend.press_key(self.key)
+
+    def release(self, backend: Backend):
+        backend.release_key(self.key)
+
+class MouseButtonAction(Action):
+    """Presses and releases a mouse button."""
+    __slots__ = ("button",)
+    def __init__(self, button):
+        self.button = button
+
+    def press(self, backend: Backend):
+        backend.press_button(self.button)
+
+    def release(self, backend: Backend):
+        backend.release_button(self.button)
+
+class MoveAction(Action):
+    """Moves the mouse by a fixed amount of pixels on press."""
+    __slots__ = ("dx", "dy")
+    def __init__(self, dx: int, dy: int):
+        self.dx = dx
+        self.dy = dy
+
+    def press(self, backend: Backend):
+        backend.move(self.dx, self.dy)
+
+class ScrollAction(Action):
+    """Scrolls the mouse wheel by a fixed amount of steps on press."""
+    __slots__ = ("dx", "dy")
+    def __init__(self, dx: int, dy: int):
+        self.dx = dx
+        self.dy = dy
+
+    def press(self, backend: Backend):
+        backend.scroll(self.dx, self.dy)
+
+# The amount special mouse inputs move the cursor or scroll wheel per press
+MOVE_DIRECTIONS = {"up": (0, -10), "down": (0, 10), "left": (-10, 0), "right": (10, 0)}
+SCROLL_DIRECTIONS = {"up": (0, 1), "down": (0, -1), "left": (-1, 0), "right": (1, 0)}
+
+CURVES = ("linear", "exponential")
+# The mouse settings of a stick that are saved with a layout, as the keyword arguments of Controller.Axis.set_mouse_mode
+MOUSE_SETTINGS = ("speed", "curve", "exponent")
+
+def check_curve(curve):
+    """Check a response curve from a saved layout or the GUI and return it, with a lookup table as a tuple of floats.\n\nRaises a
+    ValueError for an unknown curve name or a lookup table with less than 2 numbers."""
+    if isinstance(curve, str):
+        if curve not in CURVES:
+            raise ValueError(f"unknown curve '{curve}', use {' or '.join(CURVES)} or a lookup table")
+        return curve
+    try:
+        table = tuple(float(output) for output in curve)
+    except (TypeError, ValueError):
+        raise ValueError(f"the curve {curve!r} is not a list of numbers") from None
+    if len(table) < 2:
+        raise ValueError("a lookup table curve needs at least 2 numbers")
+    return table
+
+def apply_curve(curve, value: float, exponent: float=2.0):
+    """Map a stick deflection between 0 and 1 through a response curve.\n\n`curve` is "linear", "exponential" or a lookup table of outputs for evenly spaced inputs from 0 to 1."""
+    if curve == "linear":
+        return value
+    if curve == "exponential":
+        return value ** exponent
+    # Linearly interpolate between the two nearest entries of the lookup table
+    position = value * (len(curve) - 1)
+    index = min(int(position), len(curve) - 2)
+    return curve[index] + (curve[index + 1] - curve[index]) * (position - index)
+
+# Tkinter key names that aren't the name keys are bound by. Keys are bound by pynput's key names, like "esc" or "a", which every
+# backend turns into its own key codes when it sends them, so binding keys never needs pynput or a display
+KEY_TRANSLATIONS = {'escape': 'esc', 'return': 'enter'}
+# The bound names of mouse buttons and the button names the backends send
+MOUSE_BUTTONS = {'m_left': 'left', 'm_right': 'right', 'm_middle': 'middle'}
+
+def key_name(key: str):
+    """Return the name a key is bound and saved by, from its name as tkinter and the keybindings file name it. Mouse buttons and
+    movements keep their "m_" names."""
+    key = key.lower()
+    return KEY_TRANSLATIONS.get(key, key)
+
+def compile_action(key: str):
+    """Turn a bound key, mouse button or special mouse input into an action object.\n\nReturns None for inputs that can't be simulated."""
+    if key in MOUSE_BUTTONS:
+        return MouseButtonAction(MOUSE_BUTTONS[key])
+    if not key.startswith("m_"):
+        return KeyAction(key)
+    key = key[2:]
+    if key.startswith("move_") and key[5:] in MOVE_DIRECTIONS:
+        return MoveAction(*MOVE_DIRECTIONS[key[5:]])
+    if key.startswith("scroll_") and key[7:] in SCROLL_DIRECTIONS:
+        return ScrollAction(*SCROLL_DIRECTIONS[key[7:]])
+    return None
+
+# The saved names of the turbo settings of a keybind and their defaults: whether turbo is on, presses per second, duty cycle and delay in seconds
+TURBO_SETTINGS = ("on", "rate", "duty", "delay")
+TURBO_DEFAULTS = (False, 20, 0.5, 0)
 
 class Keybind:
-    def __init__(self, keyboard: KeyboardController=KeyboardController(), mouse: MouseController=MouseController()):
+    def __init__(self, backend: Backend=None):
         self.bound_keys = []                                # The key bound to this keybind
-        self.is_pressed = False                             # Whether the key is currently pressed on the keyboard
+        self.actions = []                                   # The bound keys compiled into action objects, in the same order
+        self.is_pressed = False                             # Whether the input of the keybind is pressed
+        self.keys_down = False                              # Whether the bound keys are currently pressed on the backend
         self.while_pressed = False                          # Whether the key should be pressed repeatedly while self.is_pressed is True
-        self.keyboard = keyboard                            # The keyboard controller to use for simulating input
-        self.mouse = mouse                                  # The mouse controller to use for simulating input
-        self.key_translations = {'m_left': Button.left, 'm_right': Button.right, 'm_middle': Button.middle, 'escape': Key.esc, 'return': Key.enter}
+        self.turbo_rate = 20                                # Presses per second while turbo is on
+        self.turbo_duty = 0.5                               # Fraction of each turbo press the keys are held down
+        self.turbo_delay = 0                                # Seconds the first press is held before turbo starts repeating
+        self.scheduler = None                               # The scheduler that runs turbo. Turbo is off without one
+        self.turbo_task = None                              # The next scheduled turbo press or release
+        self.turbo_down = False                             # Whether turbo currently has the keys pressed
+        self.macro = None                                   # A compiled Macro that runs instead of pressing the bound keys
+        self.macro_run = None                               # The running MacroRun while the keybind is pressed
+        self.backend = backend or get_default_backend()     # The backend the simulated input is queued on
 
     def bind_key(self, key):
-        pynput_key = self.tkinter_key_to_pynput_key(key)# if type(key) != type(Key) else key
-        if pynput_key not in self.bound_keys:
-            self.bound_keys.append(pynput_key)
+        key = key_name(key)
+        self.macro = None
+        if key not in self.bound_keys:
+            # New lists are made instead of appending, because the lists may be shared with a compiled Profile
+            self.bound_keys = [*self.bound_keys, key]
+            action = compile_action(key)
+            if action:
+                self.actions = [*self.actions, action]
 
     def clear_key(self):
+        if self.macro_run:
+            self.macro_run.cancel()
+            self.macro_run = None
+        if self.keys_down:
+            self.is_pressed = False
+            self.simulate_input()
         self.bound_keys = []
+        self.actions = []
+        self.macro = None
+
+    def set_binding(self, binding):
+        """Use a compiled `(bound keys, actions, macro, turbo)` binding, see compile_binding. Without turbo settings the defaults are used."""
+        self.bound_keys, self.actions, self.macro, turbo = binding
+        self.while_pressed, self.turbo_rate, self.turbo_duty, self.turbo_delay = turbo or TURBO_DEFAULTS
+
+    def turbo_settings(self):
+        """Return the turbo settings to save as a dictionary, or None when they are the defaults."""
+        settings = (self.while_pressed, self.turbo_rate, self.turbo_duty, self.turbo_delay)
+        if settings == TURBO_DEFAULTS:
+            return None
+        return dict(zip(TURBO_SETTINGS, settings))
+
+    def set_macro(self, macro: Macro):
+        """Run a compiled macro instead of pressing the bound keys. Replaces the bound keys."""
+        self.clear_key()
+        self.macro = macro
         
     def start(self):
         self.is_pressed = True
+        if self.macro:
+            # Macros are timed by the scheduler, so they don't run without one
+            if self.scheduler:
+                self.macro_run = self.macro.start(self.backend, self.scheduler)
+            return
         self.simulate_input()
+        if self.while_pressed and self.scheduler:
+            self.turbo_down = True
+            period = 1 / self.turbo_rate
+            self.turbo_task = self.scheduler.schedule(max(self.turbo_delay, period * self.turbo_duty), self.turbo)
         
     def stop(self):
+        if self.turbo_task:
+            self.turbo_task.cancel()
+            self.turbo_task = None
+        if self.macro_run:
+            self.macro_run.cancel()
+            self.macro_run = None
         self.is_pressed = False
         self.simulate_input()
-        
-    def always(self):
-        self.while_pressed = True
-        self.is_pressed != self.is_pressed
+
+    def turbo(self):
+        """Toggle the keys while turbo is on and schedule the next toggle. Run by the scheduler."""
+        self.turbo_task = None
+        if not self.is_pressed:
+            return
+        period = 1 / self.turbo_rate
+        self.turbo_down = not self.turbo_down or not self.while_pressed
+        self.is_pressed = self.turbo_down
         self.simulate_input()
+        self.is_pressed = True
+        if self.while_pressed:
+            self.turbo_task = self.scheduler.schedule(period * (self.turbo_duty if self.turbo_down else 1 - self.turbo_duty), self.turbo)
 
     def simulate_input(self):
-        if not self.bound_keys or len(self.bound_keys) == 0:
+        """Queue the actions of the bound keys on the backend. They are sent when the backend is flushed.\n\nNothing is queued when
+        the keys are already in the wanted state, so every press of a keybind is matched by exactly one release."""
+        if self.is_pressed == self.keys_down:
             return
-        for key in self.bound_keys:
-            if type(key) == Key or (type(key) == str and not key.startswith("m_")):
-                try:
-                    if self.is_pressed:
-                        self.keyboard.press(key)
-                        self.is_pressed = True
-                    else:
-                        self.keyboard.release(key)
-                        self.is_pressed = False
-                except Exception as e:
-                    print(f"Error simulating input for {key}: {e}")
-            elif type(key) == Button:
-                try:
-                    if self.is_pressed:
-                        self.mouse.press(key)
-                        self.is_pressed = True
-                    else:
-                        self.mouse.release(key)
-                        self.is_pressed = False
-                except Exception as e:
-                    print(f"Error simulating input for {key}: {e}")
-            else:
-                key = key.replace("m_", "")
-                if key.startswith("move_") and self.is_pressed:
-                    key = key.replace("move_", "")
-                    directions = {"up": (0, -10), "down": (0, 10), "left": (-10, 0), "right": (10, 0)}
-                    self.mouse.move(directions[key][0], directions[key][1])
-                elif key.startswith("scroll_") and self.is_pressed:
-                    key = key.replace("scroll_", "")
-                    directions = {"up": (0, 1), "down": (0, -1)}
-                    self.mouse.scroll(directions[key][0], directions[key][1])
-                
-    def tkinter_key_to_pynput_key(self, key):
-        key = key.lower()
-        if key.startswith("m_"):
-            if not key.startswith("m_move_"):
-                if hasattr(Button, key):
-                    key = getattr(Button, key, None)
-                else:
-                    key = self.key_translations.get(key, key)
+        self.keys_down = self.is_pressed
+        if self.is_pressed:
+            for action in self.actions:
+                action.press(self.backend)
         else:
-            if hasattr(Key, key):
-                key = getattr(Key, key, None)
-            else:
-                key = self.key_translations.get(key, key)
-        return key
-    
-    def pynput_keys_to_tkinter_keys(self, keys):
-        reverse_translations = {v: k for k, v in self.key_translations.items()}
-        reverse_translations.update({Key.space: 'space', Key.alt: 'alt', Key.tab: 'tab', Key.shift: 'shift'})
-        if type(keys) == dict:
-            for k, v in keys.items():
-                if type(v) == Key or type(v) == Button:
-                    keys[k] = reverse_translations[v]
-        else:
-            for i in range(len(keys)):
-                key = keys[i]
-                if type(key) == Key or type(key) == Button:
-                    keys[i] = reverse_translations[key]
-        return keys
+            for action in self.actions:
+                action.release(self.backend)
+
             
+def hysteresis_direction(value: float, direction: int, threshold: float, release: float):
+    """Return the direction of one axis of a stick. A pressed direction stays pressed until the value falls below `release`."""
+    if value >= threshold:
+        return 1
+    if value <= -threshold:
+        return -1
+    if direction and value * direction > release:
+        return direction
+    return 0
+
+def press_directions(keybinds: dict, direction, changed):
+    """Start and stop the "up", "down", "left" and "right" keybinds of a stick or hat for its `(vertical, horizontal)` direction."""
+    if changed[0]:
+        if direction[0] == 1:
+            keybinds["down"].start()
+            keybinds["up"].stop()
+        elif direction[0] == -1:
+            keybinds["up"].start()
+            keybinds["down"].stop()
+        else:
+            keybinds["up"].stop()
+            keybinds["down"].stop()
+    if changed[1]:
+        if direction[1] == 1:
+            keybinds["right"].start()
+            keybinds["left"].stop()
+        elif direction[1] == -1:
+            keybinds["left"].start()
+            keybinds["right"].stop()
+        else:
+            keybinds["right"].stop()
+            keybinds["left"].stop()
+
+def compile_turbo(settings: dict):
+    """Compile saved turbo settings into a `(on, rate, duty, delay)` tuple, limited to the values the GUI allows."""
+    on, rate, duty, delay = (settings.get(name, default) for name, default in zip(TURBO_SETTINGS, TURBO_DEFAULTS))
+    return bool(on), max(float(rate), 1), min(max(float(duty), 0.05), 0.95), max(float(delay), 0)
+
+def compile_binding(keys):
+    """Compile a saved keybind into a `(bound keys, actions, macro, turbo)` tuple.\n\nSaved keybinds are a list of key names or the source
+    of a macro. A keybind with turbo settings is saved as `{"keys": keys, "turbo": settings}`, the turbo of other keybinds is None."""
+    turbo = None
+    if isinstance(keys, dict):
+        try:
+            turbo = compile_turbo(keys.get("turbo") or {})
+        except (AttributeError, TypeError, ValueError) as e:
+            print(f"Error loading turbo settings: {e}")
+        keys = keys.get("keys", ())
+    if isinstance(keys, str):
+        try:
+            return (), (), compile_macro(keys), turbo
+        except ValueError as e:
+            print(f"Error compiling macro: {e}")
+            return Profile.EMPTY
+    bound_keys = []
+    for key in keys:
+        key = key_name(key)
+        if key not in bound_keys:
+            bound_keys.append(key)
+    actions = [compile_action(key) for key in bound_keys]
+    return tuple(bound_keys), tuple(action for action in actions if action), None, turbo
+
+def parse_numbers(argument: str, count: int, type=int):
+    """Return `count` numbers from a space separated argument, or None if it doesn't hold exactly that many."""
+    try:
+        values = [type(value) for value in argument.split()]
+    except ValueError:
+        return None
+    return values if len(values) == count else None
+
+def compile_macro(source: str):
+    """Compile the source text of a macro into a `Macro`. See Macros.py for the steps.\n\nRaises a `ValueError` describing the first step that isn't valid."""
+    steps = [step.strip() for step in source.replace("\n", ";").split(";") if step.strip()]
+    frames = []
+    actions = []
+    delay = 0.0
+    repeat = 1
+    compiled = {}       # Every key gets one action, so the macro can release a key by the action that pressed it
+    def action_for(key):
+        if key not in compiled:
+            compiled[key] = compile_action(key)
+        return compiled[key]
+    for i, step in enumerate(steps):
+        command, _, argument = step.partition(" ")
+        command, argument = command.lower(), argument.strip()
+        match command:
+            case "press" | "release" | "tap":
+                action = action_for(key_name(argument)) if argument else None
+                if action is None:
+                    raise ValueError(f"'{step}' needs a key or mouse button.")
+                if isinstance(action, (MoveAction, ScrollAction)):
+                    if command != "release":
+                        actions.append((action, None))
+                    continue
+                if command != "release":
+                    actions.append((action, True))
+                if command != "press":
+                    actions.append((action, False))
+            case "wait":
+                values = parse_numbers(argument, 1, float)
+                if values is None or values[0] < 0:
+                    raise ValueError(f"'{step}' needs a number of milliseconds.")
+                if actions:
+                    frames.append((delay, tuple(actions)))
+                    actions = []
+                    delay = 0.0
+                delay += values[0] / 1000
+            case "type":
+                for character in argument:
+                    action = action_for(character)
+                    actions.append((action, True))
+                    actions.append((action, False))
+            case "move" | "scroll":
+                values = parse_numbers(argument, 2)
+                if values is None:
+                    raise ValueError(f"'{step}' needs a horizontal and a vertical amount.")
+                actions.append((MoveAction(*values) if command == "move" else ScrollAction(*values), None))
+            case "repeat":
+                values = parse_numbers(argument, 1) if argument else [0]
+                if values is None or values[0] < 0:
+                    raise ValueError(f"'{step}' needs a number of times, or nothing to repeat until the button is released.")
+                if i != len(steps) - 1:
+                    raise ValueError(f"'{step}' can only be the last step.")
+                repeat = values[0]
+            case _:
+                raise ValueError(f"'{step}' is not a macro step.")
+    if actions or delay:
+        frames.append((delay, tuple(actions)))
+    if not frames:
+        raise ValueError("A macro needs at least one step.")
+    if repeat == 0 and not any(delay for delay, _ in frames):
+        raise ValueError("A macro that repeats until the button is released needs a wait.")
+    return Macro(source, tuple(frames), repeat)
+
+def add_chord_partners(partners: dict, mask: int):
+    """Add every button of a chord bitmask to the partners of the other buttons of the chord. `partners` maps button numbers to bitmasks."""
+    rest = mask
+    while rest:
+        bit = rest & -rest
+        index = bit.bit_length() - 1
+        partners[index] = partners.get(index, 0) | mask & ~bit
+        rest &= rest - 1
+
+class Profile:
+    """A saved layout compiled ahead of time into immutable binding tables.\n\nSwitching a controller to a profile only swaps references to
+    the compiled tables, nothing is parsed or compiled, so it takes the same time no matter how many keys are bound. The chord table
+    is built for the buttons of the controller the profile is compiled for."""
+    __slots__ = ("name", "bindings", "mouse", "chords", "chord_partners")
+    EMPTY = ((), (), None, None)
+    def __init__(self, name: str, bindings: dict, mouse: dict, chords: dict=None, chord_partners: dict=None):
+        self.name = name
+        self.bindings = bindings    # Maps (input name, direction) to (bound keys, actions, macro, turbo). The direction is None for buttons and triggers
+        self.mouse = mouse          # Maps the names of sticks in mouse mode to their mouse settings
+        self.chords = chords or {}  # Maps the bitmasks of button numbers to the Chord they press, like Controller.chords
+        self.chord_partners = chord_partners or {}  # Maps button numbers to a bitmask of the buttons they make a chord with
+
+    @classmethod
+    def compile(cls, name: str, keybindings: dict, controller=None):
+        """Compile the keybindings of a saved layout, as stored in the keybindings file. Chords are only compiled with a `Controller`."""
+        bindings = {}
+        mouse = {}
+        chords = {}
+        chord_partners = {}
+        for input_name, bound_keys in keybindings.items():
+            if input_name == "chords":
+                # Chords are saved under a reserved name, as "l1+x": keys
+                if controller is None:
+                    continue
+                for names, keys in bound_keys.items():
+                    try:
+                        chord = controller.make_chord(names.split("+"), compile_binding(keys))
+                    except ValueError as e:
+                        print(f"Error loading chord of {name}: {e}")
+                        continue
+                    chords[chord.mask] = chord
+                    add_chord_partners(chord_partners, chord.mask)
+            elif isinstance(bound_keys, dict) and "keys" not in bound_keys:
+                # Sticks and hats save a keybind per direction. A dictionary with "keys" is a single keybind with turbo settings
+                for direction, keys in bound_keys.items():
+                    if direction == "mouse":
+                        # Only the settings set_mouse_mode takes are kept, so unknown or older settings don't break switching to the profile
+                        settings = {setting: keys[setting] for setting in MOUSE_SETTINGS if isinstance(keys, dict) and setting in keys}
+                        if "curve" in settings:
+                            try:
+                                settings["curve"] = check_curve(settings["curve"])
+                            except ValueError as e:
+                                print(f"Error loading the mouse curve of {input_name} in {name}: {e}")
+                                del settings["curve"]
+                        mouse[input_name] = settings
+                    else:
+                        bindings[(input_name, direction)] = compile_binding(keys)
+            else:
+                bindings[(input_name, None)] = compile_binding(bound_keys)
+        return cls(name, bindings, mouse, chords, chord_partners)
+
+# The states of a button that is part of a chord, while it is pressed
+PENDING = 1     # Pressed while a partner was held, but not a tap, a hold or part of a chord yet
+HOLD = 2        # Its own keybind is pressed, because no partner was held when it was pressed or it was held longer than the hold time
+CONSUMED = 3    # Part of a chord that was pressed, or held when it joined a chord. Its own keybind isn't used until it is released
+
+class Chord:
+    """A keybind that is pressed while a set of buttons is held together, like "l1 + x".\n\nA layer, where holding a button changes
+    what other buttons do, is a chord per button of the layer."""
+    __slots__ = ("names", "mask", "size", "buttons", "keybind")
+    def __init__(self, buttons, keybind: Keybind):
+        self.names = frozenset(button.name for button in buttons)
+        self.mask = 0               # Bitmask of the button numbers of the chord
+        for button in buttons:
+            self.mask |= 1 << button.input
+        self.size = len(buttons)    # Bigger chords win over the smaller chords they contain
+        self.buttons = tuple(buttons)
+        self.keybind = keybind
 
 class Controller:
     class Input:
         def __init__(self, name: str):
             self.name = name            # The name of the input
-            self.keybind = None         # The keybind associated with the input.This is a Keybind object for Button and Trigger inputs and a dictionary of Keybind objects for Axis inputs
+            self.keybind = None         # The keybind associated with the input.This is a Keybind object for Button and Trigger inputs and a dictionary of Keybind objects for Axis and Hat inputs
             self.changed = False        # Whether the input has changed state since the last poll
+
+        def is_active(self):
+            """Whether the input is currently pressed or deflected."""
+            return False
+
+        def reset(self):
+            """Forget the state of the input, as if it was never touched."""
+            self.changed = False
             
     class Button(Input):
         def __init__(self, name: str, input: int):
@@ -113,31 +467,66 @@ class Controller:
             self.pressed = False
             self.last_pressed = False
             self.keybind = Keybind()
+            # Buttons that are part of a chord leave their keybind to the controller, which decides between the chord, a tap and a hold
+            self.deferred = False
+            self.chord_state = None     # PENDING, HOLD or CONSUMED while a deferred button is pressed
+            self.hold_task = None       # Turns a pending press into a hold after the controller's hold time
+            self.tap_task = None        # Releases the keybind of a tap after the controller's tap time
             
-        def update(self, joystick: pygame.joystick):
+        def update(self, joystick: "pygame.joystick", now: float):
+            self.set_state(joystick.get_button(self.input))
+
+        def set_state(self, pressed: bool):
+            """Update the button from an already read value."""
             self.last_pressed = self.pressed
-            self.pressed = joystick.get_button(self.input)
+            self.pressed = pressed
             self.changed = self.last_pressed != self.pressed
             
-            if self.pressed and self.keybind.while_pressed:
-                self.keybind.always()
-                
-            elif self.changed:
+            if self.changed and not self.deferred:
                 if self.pressed:
                     self.keybind.start()
                 else:
                     self.keybind.stop()
 
+        def is_active(self):
+            return self.pressed
+
+        def reset(self):
+            super().reset()
+            self.pressed = False
+            self.last_pressed = False
+            self.chord_state = None
+            self.cancel_tasks()
+
+        def cancel_tasks(self):
+            """Cancel the pending hold and tap release of a chord button."""
+            if self.hold_task:
+                self.hold_task.cancel()
+                self.hold_task = None
+            if self.tap_task:
+                self.tap_task.cancel()
+                self.tap_task = None
+
     class Axis(Input):
-        def __init__(self, name: str, inputX: int, inputY: int, deadzone: float=0.2):
+        def __init__(self, name: str, inputX: int, inputY: int, threshold: float=0.1, hysteresis: float=0.05):
             super().__init__(name)
             self.inputX = inputX
             self.inputY = inputY
-            self.deadzone = deadzone
-            self.X = 0
+            self.threshold = threshold                  # Filtered deflection that presses a direction
+            self.release = threshold - hysteresis       # Filtered deflection a pressed direction has to fall below to be released
+            self.filter = None                          # The StickFilter that smooths the stick and removes its deadzone
+            self.X = 0                                  # The filtered deflection, 0 inside the deadzone
             self.Y = 0
             self.direction = (0, 0)
             self.last_direction = (0, 0)
+            # Mouse mode moves the cursor with a speed relative to the stick's deflection instead of using the direction keybinds
+            self.mouse_mode = False
+            self.mouse_speed = 1000         # Cursor speed in pixels per second at full deflection
+            self.curve = "linear"           # Response curve, see apply_curve
+            self.curve_exponent = 2.0
+            self.remainder_x = 0.0          # Fractions of a pixel that haven't been moved yet
+            self.remainder_y = 0.0
+            self.last_move_time = None
             self.keybind = {
                 "up": Keybind(),
                 "down": Keybind(),
@@ -145,199 +534,701 @@ class Controller:
                 "right": Keybind(),
             }
             
-        def update(self, joystick: pygame.joystick):
-            raw_x = joystick.get_axis(self.inputX)
-            raw_y = joystick.get_axis(self.inputY)
+        def update(self, joystick: "pygame.joystick", now: float):
+            self.set_state(*self.filter.read(joystick, now))
 
-            # Apply deadzone
-            self.X = raw_x if abs(raw_x) > self.deadzone else 0
-            self.Y = raw_y if abs(raw_y) > self.deadzone else 0
+        def set_state(self, x: float, y: float):
+            """Update the axis from already filtered values."""
+            self.X = x
+            self.Y = y
+            if self.mouse_mode:
+                if not self.is_active():
+                    self.last_move_time = None
+                return
             
             self.last_direction = self.direction
             self.direction = (
-                -1 if self.Y < -self.deadzone else (1 if self.Y > self.deadzone else 0),
-                -1 if self.X < -self.deadzone else (1 if self.X > self.deadzone else 0),
+                hysteresis_direction(y, self.direction[0], self.threshold, self.release),
+                hysteresis_direction(x, self.direction[1], self.threshold, self.release),
             )
             self.changed = (self.direction[0] != self.last_direction[0], self.direction[1] != self.last_direction[1])
+            press_directions(self.keybind, self.direction, self.changed)
+
+        def reset(self):
+            super().reset()
+            self.X = self.Y = 0
+            self.direction = self.last_direction = (0, 0)
+            self.last_move_time = None
+
+        def is_active(self):
+            if self.mouse_mode:
+                return self.X != 0 or self.Y != 0
+            return self.direction != (0, 0)
+
+        def set_mouse_mode(self, enabled: bool, speed: float=None, curve=None, exponent: float=None):
+            """Switch mouse mode on or off. Releases the direction keybinds when it is switched on.\n\nRaises a ValueError for an invalid
+            curve, see check_curve."""
+            if curve is not None:
+                curve = check_curve(curve)
+            if speed is not None:
+                self.mouse_speed = speed
+            if curve is not None:
+                self.curve = curve
+            if exponent is not None:
+                self.curve_exponent = exponent
+            if enabled and not self.mouse_mode:
+                for keybind in self.keybind.values():
+                    if keybind.is_pressed:
+                        keybind.stop()
+                self.direction = (0, 0)
+            self.mouse_mode = enabled
+            self.last_move_time = None
+
+        def mouse_delta(self, now: float):
+            """Return the whole pixels the cursor should move since the last call.\n\nThe speed only depends on the time between calls, not on how often this is called."""
+            if self.last_move_time is None:
+                self.last_move_time = now
+                self.remainder_x = 0.0
+                self.remainder_y = 0.0
+                return 0, 0
+            dt = min(now - self.last_move_time, 0.1)   # Don't jump across the screen after a stall
+            self.last_move_time = now
             
-            if self.direction[0] == -1 and self.keybind["up"].while_pressed:
-                self.keybind["up"].always()
-            if self.direction[0] == 1 and self.keybind["down"].while_pressed:
-                self.keybind["down"].always()
-            if self.direction[1] == -1 and self.keybind["left"].while_pressed:
-                self.keybind["left"].always()
-            if self.direction[1] == 1 and self.keybind["right"].while_pressed:
-                self.keybind["right"].always()
+            # The filter already scaled the deflection past the deadzone to 0-1, so movement starts smoothly
+            magnitude = math.hypot(self.X, self.Y)
+            if magnitude == 0:
+                return 0, 0
+            speed = apply_curve(self.curve, min(magnitude, 1.0), self.curve_exponent) * self.mouse_speed / magnitude
             
-            if self.changed[0]:
-                if self.direction[0] == 1:
-                    self.keybind["down"].start()
-                    self.keybind["up"].stop()
-                elif self.direction[0] == -1:
-                    self.keybind["up"].start()
-                    self.keybind["down"].stop()
-                else:
-                    self.keybind["up"].stop()
-                    self.keybind["down"].stop()
-            if self.changed[1]:
-                if self.direction[1] == 1:
-                    self.keybind["right"].start()
-                    self.keybind["left"].stop()
-                elif self.direction[1] == -1:
-                    self.keybind["left"].start()
-                    self.keybind["right"].stop()
-                else:
-                    self.keybind["right"].stop()
-                    self.keybind["left"].stop()
+            x = self.X * speed * dt + self.remainder_x
+            y = self.Y * speed * dt + self.remainder_y
+            dx, dy = int(x), int(y)
+            self.remainder_x, self.remainder_y = x - dx, y - dy
+            return dx, dy
+
 
     class Trigger(Input):
-        def __init__(self, name: str, input: int, normal: float = 0, threshold: float = 0):
+        def __init__(self, name: str, input: int, threshold: float=0.5, hysteresis: float=0.1):
             super().__init__(name)
             self.input = input
-            self.value = 0
-            self.normal = normal
-            self.threshold = threshold
+            self.value = 0                              # How far the trigger is pulled, from 0 to 1
+            self.threshold = threshold                  # Value that presses the trigger
+            self.release = threshold - hysteresis       # Value a pressed trigger has to fall below to be released
+            self.filter = None                          # The TriggerFilter that scales the trigger from its resting value
             self.pressed = False
             self.last_pressed = False
             self.keybind = Keybind()
             
-        def update(self, joystick: pygame.joystick):
-            self.value = joystick.get_axis(self.input)
+        def update(self, joystick: "pygame.joystick", now: float):
+            self.set_state(*self.filter.read(joystick, now))
+
+        def set_state(self, value: float):
+            """Update the trigger from an already filtered value."""
+            self.value = value
             self.last_pressed = self.pressed
-            self.pressed = self.value >= self.threshold
+            self.pressed = value > self.release if self.pressed else value > self.threshold
             self.changed = self.last_pressed != self.pressed
 
-            if self.pressed and self.keybind.while_pressed:
-                self.keybind.always()
-                
-            elif self.changed:
+            if self.changed:
                 if self.pressed:
                     self.keybind.start()
                 else:
                     self.keybind.stop()
+
+        def is_active(self):
+            return self.pressed
+
+        def reset(self):
+            super().reset()
+            self.value = 0
+            self.pressed = False
+            self.last_pressed = False
             
-    def __init__(self):
-        self.input_types = [self.Button, self.Axis, self.Trigger, "DummyButton", "DummyAxis", "DummyTrigger"] # Dummy types are used for controllers that don't have buttons or axes in numerical order (cough cough. joycons. cough)
+    class Hat(Input):
+        """A D-pad the joystick reports as a hat. Like a stick, every direction has its own keybind."""
+        def __init__(self, name: str, input: int):
+            super().__init__(name)
+            self.input = input
+            self.value = (0, 0)
+            self.direction = (0, 0)
+            self.last_direction = (0, 0)
+            self.keybind = {
+                "up": Keybind(),
+                "down": Keybind(),
+                "left": Keybind(),
+                "right": Keybind(),
+            }
+
+        def update(self, joystick: "pygame.joystick", now: float):
+            self.set_state(joystick.get_hat(self.input))
+
+        def set_state(self, value):
+            """Update the hat from an already read `(x, y)` value."""
+            self.value = value
+            self.last_direction = self.direction
+            self.direction = (-value[1], value[0])     # Hats report up as a positive y, sticks as a negative y
+            self.changed = (self.direction[0] != self.last_direction[0], self.direction[1] != self.last_direction[1])
+            press_directions(self.keybind, self.direction, self.changed)
+
+        def is_active(self):
+            return self.direction != (0, 0)
+
+        def reset(self):
+            super().reset()
+            self.value = (0, 0)
+            self.direction = self.last_direction = (0, 0)
+
+    def __init__(self, backend: Backend=None, scheduler: Scheduler=None):
         self.joystick = None
+        self.layout = None      # The compiled ControllerLayouts.Layout of the joystick
         self.inputs = {}
         self.pressed = []
         self.held = []
         self.released = []
         self.sticks = []
+        self.buttons = {}       # Maps the joystick's button numbers to the inputs that read them
+        self.axes = {}          # Maps the joystick's axis numbers to the inputs that read them
+        self.hats = {}          # Maps the joystick's hat numbers to the inputs that read them
+        self.active = set()     # Inputs that are currently pressed or deflected
+        self.mouse_sticks = set()   # Active sticks in mouse mode, these move the mouse on every frame
+        self.scheduler = scheduler or Scheduler()   # Runs the turbo keybinds. Can be shared with other controllers
+        self.profile = None         # The Profile that was switched to last
+        self.profiles = {}          # Maps (filename, layout name) to the (saved keybindings, Profile) it was compiled from
+        self.profile_combos = {}    # Maps sets of button names to the (layout name, filename) they switch to when held together
+        self.chords = {}            # Maps the bitmasks of button numbers to the Chord they press
+        self.chord_mask = 0         # Bitmask of the buttons that are part of a chord and held
+        self.active_chords = []     # Chords whose keybind is pressed
+        self.chord_partners = {}    # Maps the button numbers of chord buttons to a bitmask of every button they make a chord with
+        self.hold_time = 0.2        # Seconds a button that is part of a chord is held before it counts as a hold instead of a tap
+        self.tap_time = 0.02        # Seconds the keys of a tap are held, a bit longer than a frame at 60 fps so games that poll see them
+        self.filters = None         # The FilterPipeline of the sticks and triggers of the layout
+        self.calibration = None     # The Calibration of the joystick, or None if it wasn't calibrated
+        self.settling = {}          # Maps smoothed inputs that are still catching up with their last event to their next settle task
+        self.settle_interval = 1 / 120
+        self.triggers = []
+        # Raw joystick state, indexed by the joystick's button and axis numbers. poll swaps the current and last buffers instead of reallocating them
+        self.button_indices = array("i")
+        self.axis_indices = array("i")
+        self.hat_indices = array("i")
+        self.button_states = array("B")
+        self.last_button_states = array("B")
+        self.axis_states = array("d")
+        self.last_axis_states = array("d")
+        self.hat_states = array("b")       # The x and y of hat i are at 2 * i and 2 * i + 1
+        self.last_hat_states = array("b")
+        self.backend = backend or get_default_backend()     # The backend every keybind of the controller queues its input on
         
-    def set_joystick(self, joystick: pygame.joystick):
+    def set_joystick(self, joystick: "pygame.joystick"):
+        """Map a joystick. When it has the same name as the current joystick, for example when a controller reconnects, the inputs and their keybinds are kept."""
+        self.release_all()
+        if self.joystick and self.inputs and joystick.get_name() == self.joystick.get_name():
+            self.joystick = joystick
+            for input in self.inputs.values():
+                input.reset()
+            self.active = set()
+            self.mouse_sticks = set()
+            self.chord_mask = 0
+            self.set_filters()
+            self.allocate_buffers()
+            return
         self.joystick = joystick
-        inputs = GetControllerLayout(joystick.get_name())
+        self.profile = None
+        self.profiles = {}
+        self.calibration = None
+        self.layout = GetControllerLayout(joystick)
         self.inputs = {}
-        button_count = 0
-        axis_count = 0
-        for key, value in inputs.items():
-            input_type = self.input_types[value]
-            match input_type:
-                case self.Button:
-                    self.inputs[key] = input_type(key, button_count)
-                    button_count += 1
-                case self.Axis:
-                    self.inputs[key] = input_type(key, axis_count, axis_count + 1, 0.1)
-                    self.sticks.append(self.inputs[key])
-                    axis_count += 2
-                case self.Trigger:
-                    self.inputs[key] = input_type(key, axis_count, 0, 0)
-                    axis_count += 1
-                case "DummyButton":
-                    button_count += 1
-                case "DummyAxis":
-                    axis_count += 2
-                case "DummyTrigger":
-                    axis_count += 1
+        self.sticks = []
+        self.buttons = {}
+        self.axes = {}
+        self.hats = {}
+        self.active = set()
+        self.mouse_sticks = set()
+        self.triggers = []
+        self.chords = {}
+        self.chord_partners = {}
+        self.chord_mask = 0
+        self.active_chords = []
+        for name, type, indices in self.layout.inputs:
+            match type:
+                case "button":
+                    self.inputs[name] = self.Button(name, indices[0])
+                    self.buttons[indices[0]] = self.inputs[name]
+                case "stick":
+                    self.inputs[name] = self.Axis(name, indices[0], indices[1])
+                    self.sticks.append(self.inputs[name])
+                    self.axes[indices[0]] = self.inputs[name]
+                    self.axes[indices[1]] = self.inputs[name]
+                case "trigger":
+                    self.inputs[name] = self.Trigger(name, indices[0])
+                    self.axes[indices[0]] = self.inputs[name]
+                    self.triggers.append(self.inputs[name])
+                case "hat":
+                    self.inputs[name] = self.Hat(name, indices[0])
+                    self.hats[indices[0]] = self.inputs[name]
+        self.set_filters()
+        self.allocate_buffers()
+        for keybind in self.keybinds():
+            keybind.backend = self.backend
+            keybind.scheduler = self.scheduler
+
+    def release_all(self):
+        """Release every keybind that is still pressed and stop its turbo."""
+        for keybind in self.input_keybinds():
+            if keybind.is_pressed or keybind.turbo_task or keybind.macro_run:
+                keybind.stop()
+        # Only the active chords can hold anything, so the chord table isn't walked
+        for chord in self.active_chords:
+            chord.keybind.stop()
+        for task in self.settling.values():
+            task.cancel()
+        self.settling = {}
+        # Chord buttons that are still held do nothing more until they are released
+        self.active_chords = []
+        for button in self.buttons.values():
+            if button.chord_state:
+                button.chord_state = CONSUMED if button.pressed else None
+            button.cancel_tasks()
+
+    def keybinds(self):
+        """Iterate over every keybind of every input and chord."""
+        yield from self.input_keybinds()
+        for chord in self.chords.values():
+            yield chord.keybind
+
+    def input_keybinds(self):
+        """Iterate over every keybind of every input."""
+        for input in self.inputs.values():
+            if isinstance(input.keybind, dict):
+                yield from input.keybind.values()
+            else:
+                yield input.keybind
+
+    def named_keybinds(self):
+        """Iterate over `(input name, direction, keybind)` for every keybind. The direction is None for buttons and triggers."""
+        for name, input in self.inputs.items():
+            if isinstance(input.keybind, dict):
+                for direction, keybind in input.keybind.items():
+                    yield name, direction, keybind
+            else:
+                yield name, None, input.keybind
+
+    def get_profile(self, layout_name, filename="keybindings.bin"):
+        """Return the compiled profile of a saved layout, or None if it doesn't exist. Profiles are compiled once and recompiled when the saved layout changes."""
+        keybindings = get_store(filename).get(self.joystick.get_name(), layout_name)
+        if keybindings is None:
+            return None
+        cached = self.profiles.get((filename, layout_name))
+        if cached and cached[0] is keybindings:
+            return cached[1]
+        profile = Profile.compile(layout_name, keybindings, self)
+        self.profiles[(filename, layout_name)] = (keybindings, profile)
+        return profile
+
+    def preload_profiles(self, filename="keybindings.bin"):
+        """Compile every layout saved for the controller, so switching to any of them doesn't compile anything."""
+        for layout_name in self.load_all_layout_names(filename) or []:
+            self.get_profile(layout_name, filename)
+
+    def switch_profile(self, profile: Profile):
+        """Replace all keybinds with a compiled profile. Keys the old keybinds still hold are released first."""
+        self.release_all()
+        bindings = profile.bindings
+        for name, direction, keybind in self.named_keybinds():
+            keybind.set_binding(bindings.get((name, direction), Profile.EMPTY))
+        for stick in self.sticks:
+            settings = profile.mouse.get(stick.name)
+            stick.set_mouse_mode(settings is not None, **(settings or {}))
+        self.clear_chords()
+        # The chord tables are shared with the profile. add_chord copies them before it changes them
+        self.chords = profile.chords
+        self.chord_partners = profile.chord_partners
+        self.update_deferred()
+        self.profile = profile
+
+    def bind_profile_combo(self, buttons, layout_name, filename="keybindings.bin"):
+        """Switch to a saved layout when all of the given buttons are held together. The layout is compiled right away.\n\n
+        Raises a `ValueError` if a button isn't an input of the controller or the layout isn't saved for it."""
+        for name in buttons:
+            if name not in self.inputs:
+                raise ValueError(f"'{name}' is not an input of {self.joystick.get_name()}")
+        if self.get_profile(layout_name, filename) is None:
+            raise ValueError(f"no layout '{layout_name}' is saved for {self.joystick.get_name()}")
+        self.profile_combos[frozenset(buttons)] = (layout_name, filename)
+
+    def check_profile_combos(self):
+        """Switch profiles when a button that was just pressed completes a profile combo."""
+        held = {input.name for input in self.active if getattr(input, "pressed", False)}
+        for combo, (layout_name, filename) in self.profile_combos.items():
+            if combo <= held and not combo.isdisjoint(self.pressed):
+                profile = self.get_profile(layout_name, filename)
+                if profile and profile is not self.profile:
+                    self.switch_profile(profile)
+                return
         
+    def set_filters(self):
+        """Give every stick and trigger a fresh filter with the settings of the layout."""
+        self.filters = FilterPipeline(self.layout, self.calibration)
+        for name, filter in self.filters.filters.items():
+            input = self.inputs[name]
+            input.filter = filter
+            settings = filter.settings
+            input.threshold = settings["threshold"]
+            input.release = settings["threshold"] - settings["hysteresis"]
+
+    def set_calibration(self, calibration: Calibration):
+        """Calibrate the sticks and triggers, or remove the calibration if it is None."""
+        self.calibration = calibration
+        self.set_filters()
+
+    def load_calibration(self, filename="keybindings.bin"):
+        """Calibrate the sticks and triggers with the calibration saved for the joystick's GUID, if there is one."""
+        self.set_calibration(read_calibration(self.joystick, filename))
+
+    def save_calibration(self, calibration: Calibration, filename="keybindings.bin"):
+        """Calibrate the sticks and triggers and save the calibration for the joystick's GUID."""
+        write_calibration(self.joystick, calibration, filename)
+        self.set_calibration(calibration)
+
+    def allocate_buffers(self):
+        """Allocate the state buffers for the mapped button and axis numbers of the layout."""
+        self.button_indices = self.layout.button_indices
+        self.axis_indices = self.layout.axis_indices
+        self.hat_indices = self.layout.hat_indices
+        button_size = self.button_indices[-1] + 1 if self.button_indices else 0
+        axis_size = self.axis_indices[-1] + 1 if self.axis_indices else 0
+        self.button_states = array("B", bytes(button_size))
+        self.last_button_states = array("B", bytes(button_size))
+        self.raw_axis_states = array("d", bytes(8 * axis_size))     # The axes as read, before they are filtered into axis_states
+        self.axis_states = array("d", bytes(8 * axis_size))
+        self.last_axis_states = array("d", bytes(8 * axis_size))
+        hat_size = 2 * (self.hat_indices[-1] + 1) if self.hat_indices else 0
+        self.hat_states = array("b", bytes(hat_size))
+        self.last_hat_states = array("b", bytes(hat_size))
+
     def poll(self):
         """Poll the controller for input and update the controller's internal state.\n\nRaises an `Exception` if no joystick is set."""
         if not self.joystick:
             raise Exception("No joystick set.")
         
         # Reset the lists of pressed, held, and released buttons
-        self.pressed = []
-        self.held = []
-        self.released = []
+        self.pressed.clear()
+        self.held.clear()
+        self.released.clear()
         
-        # Dictionaries to store the previous and new states of the inputs
-        prev_states = {}
-        new_states = {}
+        # Swap the buffers so the state of the last poll becomes the previous state
+        self.button_states, self.last_button_states = self.last_button_states, self.button_states
+        self.axis_states, self.last_axis_states = self.last_axis_states, self.axis_states
+        buttons, last_buttons = self.button_states, self.last_button_states
+        axes, last_axes = self.axis_states, self.last_axis_states
+        self.hat_states, self.last_hat_states = self.last_hat_states, self.hat_states
+        hats, last_hats = self.hat_states, self.last_hat_states
         
-        # Iterate over all inputs and update their states
-        for key, value in self.inputs.items():
-            # Check if the input has a "pressed" attribute. Applies to buttons and triggers
-            if hasattr(value, "pressed"):
-                # Store the previous state
-                prev_states[key] = value.pressed
-                # Update the input state
-                value.update(self.joystick)
-                # Store the new state
-                new_states[key] = value.pressed
-            else:
-                value.update(self.joystick)
+        # Read the raw state of every mapped button, axis and hat
+        joystick = self.joystick
+        for i in self.button_indices:
+            buttons[i] = joystick.get_button(i)
+        raw_axes = self.raw_axis_states
+        for i in self.axis_indices:
+            raw_axes[i] = joystick.get_axis(i)
+        for i in self.hat_indices:
+            hats[2 * i], hats[2 * i + 1] = joystick.get_hat(i)
+        # Filter every stick and trigger in one pass, so axes that only moved inside their deadzone don't count as changed
+        self.filters.run(raw_axes, axes, self.scheduler.clock())
         
-        # Determine which buttons are pressed, held, or released
-        for key, value in new_states.items():
-            if value and not prev_states[key]:
-                self.pressed.append(key)
-            elif not value and prev_states[key]:
-                self.released.append(key)
-            elif value and prev_states[key]:
-                self.held.append(key)
-                
-    def save_keybindings(self, layout_name, filename="keybindings.json"):
-        try:
-            with open(filename, "r") as f:
-                all_keybindings = json.load(f)
-        except FileNotFoundError:
-            all_keybindings = {}
+        # Only update the inputs whose raw state changed
+        for i in self.button_indices:
+            if buttons[i] != last_buttons[i]:
+                input = self.buttons[i]
+                input.set_state(buttons[i])
+                if input.deferred:
+                    self.update_chords(input)
+                if buttons[i]:
+                    self.pressed.append(input.name)
+                else:
+                    self.released.append(input.name)
+                self.set_active(input)
+            elif buttons[i]:
+                self.held.append(self.buttons[i].name)
+        for i in self.axis_indices:
+            if axes[i] != last_axes[i]:
+                input = self.axes[i]
+                if isinstance(input, self.Trigger):
+                    continue
+                input.set_state(axes[input.inputX], axes[input.inputY])
+                self.set_active(input)
+        for i in self.hat_indices:
+            if hats[2 * i] != last_hats[2 * i] or hats[2 * i + 1] != last_hats[2 * i + 1]:
+                input = self.hats[i]
+                input.set_state((hats[2 * i], hats[2 * i + 1]))
+                self.set_active(input)
+        
+        # Triggers are pressed by a threshold, so their pressed state is checked on every poll
+        for trigger in self.triggers:
+            trigger.set_state(axes[trigger.input])
+            if trigger.pressed and not trigger.last_pressed:
+                self.pressed.append(trigger.name)
+            elif trigger.last_pressed and not trigger.pressed:
+                self.released.append(trigger.name)
+            elif trigger.pressed:
+                self.held.append(trigger.name)
+            self.set_active(trigger)
+
+        if self.pressed and self.profile_combos:
+            self.check_profile_combos()
+
+        # Fire the turbo keybinds that are due and move the mouse for sticks in mouse mode
+        self.scheduler.run_due()
+        self.move_mouse()
+        self.backend.flush()
+
+    def handle_event(self, event: "pygame.event.Event"):
+        """Update only the input touched by a pygame joystick event and return it.\n\nEvents from other joysticks are ignored and return None."""
+        import pygame           # Already imported by whoever made the event, so this only looks it up
+        if not self.joystick or event.instance_id != self.joystick.get_instance_id():
+            return
+        
+        self.pressed.clear()
+        self.released.clear()
+        
+        if event.type in (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP):
+            input = self.buttons.get(event.button)
+        elif event.type == pygame.JOYAXISMOTION:
+            input = self.axes.get(event.axis)
+        elif event.type == pygame.JOYHATMOTION:
+            input = self.hats.get(event.hat)
+        else:
+            return
+        if input is None:
+            return
+        
+        was_pressed = getattr(input, "pressed", False)
+        input.update(self.joystick, self.scheduler.clock())
+        if getattr(input, "deferred", False) and input.changed:
+            self.update_chords(input)
+        self.set_active(input)
+        if getattr(input, "filter", None) and input.filter.settling and input not in self.settling:
+            self.settling[input] = self.scheduler.schedule(self.settle_interval, lambda: self.settle(input))
+        
+        if hasattr(input, "pressed"):
+            if input.pressed and not was_pressed:
+                self.pressed.append(input.name)
+            elif was_pressed and not input.pressed:
+                self.released.append(input.name)
+        self.held.clear()
+        self.held.extend(input.name for input in self.active if getattr(input, "pressed", False))
+        if self.pressed and self.profile_combos:
+            self.check_profile_combos()
+        return input
+
+    def settle(self, input: Input):
+        """Filter a smoothed stick or trigger again until its smoothing caught up with the last event. Run by the scheduler.\n\n
+        Without this a stick that is let go would stay where the smoothing was at its last event."""
+        input.set_state(*input.filter.step(self.scheduler.clock()))
+        self.set_active(input)
+        if input.filter.settling:
+            self.settling[input] = self.scheduler.schedule(self.settle_interval, lambda: self.settle(input))
+        else:
+            del self.settling[input]
 
-        controller_name = self.joystick.get_name()
-        if controller_name not in all_keybindings:
-            all_keybindings[controller_name] = {}
+    def set_active(self, input: Input):
+        """Add or remove the input from the active inputs after its state changed."""
+        if input.is_active():
+            self.active.add(input)
+            if isinstance(input, self.Axis) and input.mouse_mode:
+                self.mouse_sticks.add(input)
+        else:
+            self.active.discard(input)
+            self.mouse_sticks.discard(input)
 
+    def move_mouse(self):
+        """Move the mouse for every active stick in mouse mode."""
+        if not self.mouse_sticks:
+            return
+        dx, dy = 0, 0
+        now = self.scheduler.clock()
+        for input in self.mouse_sticks:
+            if input.mouse_mode:
+                x, y = input.mouse_delta(now)
+                dx += x
+                dy += y
+        # All sticks are combined into a single move per frame
+        if dx or dy:
+            self.backend.move(dx, dy)
+
+    def snapshot(self):
+        """Return a copy of the controller state for displaying on another thread."""
+        return {
+            "held": [input.name for input in self.active if getattr(input, "pressed", False)],
+            "sticks": [(axis.name, axis.X, axis.Y, axis.direction) for axis in self.sticks],
+            "hats": [(hat.name, hat.value) for hat in self.hats.values()],
+        }
+                
+    def save_keybindings(self, layout_name, filename="keybindings.bin"):
+        def serialise(keybind):
+            # Macros are saved as their source
+            keys = keybind.macro.source if keybind.macro else list(keybind.bound_keys)
+            turbo = keybind.turbo_settings()
+            return {"keys": keys, "turbo": turbo} if turbo else keys
         keybindings = {}
         for key, input in self.inputs.items():
-            if isinstance(input, self.Axis):
-                keybindings[key] = {k: v.bound_keys for k, v in input.keybind.items()}
+            if isinstance(input.keybind, dict):
+                keybindings[key] = {k: serialise(v) for k, v in input.keybind.items()}
+                if isinstance(input, self.Axis) and input.mouse_mode:
+                    keybindings[key]["mouse"] = {"speed": input.mouse_speed, "curve": input.curve, "exponent": input.curve_exponent}
             else:
-                keybindings[key] = input.keybind.bound_keys
+                keybindings[key] = serialise(input.keybind)
+        if self.chords:
+            keybindings["chords"] = {"+".join(button.name for button in chord.buttons): serialise(chord.keybind) for chord in self.chords.values()}
 
-        serialised_keybindings = {k: Keybind().pynput_keys_to_tkinter_keys(v) for k, v in keybindings.items()}
-        all_keybindings[controller_name][layout_name] = serialised_keybindings
+        get_store(filename).put(self.joystick.get_name(), layout_name, keybindings)
 
-        with open(filename, "w") as f:
-            json.dump(all_keybindings, f, indent=4)
+    def bind_chord(self, buttons, keys):
+        """Press keys, or run a macro when `keys` is macro source, while all of the given buttons are held.\n\nRaises a `ValueError`
+        if one of the buttons doesn't exist. Only buttons can be part of a chord."""
+        self.add_chord(buttons, compile_binding(keys))
 
-    def load_keybindings(self, layout_name, filename="keybindings.json"):
-        try:
-            with open(filename, "r") as f:
-                all_keybindings = json.load(f)
-            controller_name = self.joystick.get_name()
-            if controller_name in all_keybindings and layout_name in all_keybindings[controller_name]:
-                keybindings = all_keybindings[controller_name][layout_name]
-                for key, bound_keys in keybindings.items():
-                    if key in self.inputs:
-                        if isinstance(self.inputs[key], self.Axis):
-                            for k, v in bound_keys.items():
-                                for bound_key in v:
-                                    self.inputs[key].keybind[k].bind_key(bound_key)
-                        else:
-                            for bound_key in bound_keys:
-                                self.inputs[key].keybind.bind_key(bound_key)
-        except FileNotFoundError:
-            pass
+    def add_chord(self, buttons, binding):
+        """Add a chord with a compiled (bound keys, actions, macro, turbo) binding, replacing the chord of the same buttons."""
+        chord = self.make_chord(buttons, binding)
+        old = self.chords.get(chord.mask)
+        if old:
+            self.stop_chord(old)
+        # New tables are made instead of changing them, because they may be shared with a compiled Profile
+        self.chords = {**self.chords, chord.mask: chord}
+        self.chord_partners = dict(self.chord_partners)
+        add_chord_partners(self.chord_partners, chord.mask)
+        self.update_deferred()
+
+    def make_chord(self, buttons, binding):
+        """Return a Chord of button names and a compiled binding. Raises a `ValueError` if the buttons can't make a chord."""
+        members = []
+        for name in buttons:
+            if not isinstance(self.inputs.get(name), self.Button):
+                raise ValueError(f"'{name}' is not a button of {self.joystick.get_name()}")
+            members.append(self.inputs[name])
+        if len(set(members)) < 2:
+            raise ValueError(f"a chord needs at least two buttons, got '{'+'.join(buttons)}'")
+        keybind = Keybind(self.backend)
+        keybind.scheduler = self.scheduler
+        keybind.set_binding(binding)
+        return Chord(members, keybind)
+
+    def clear_chords(self):
+        """Remove every chord. The buttons go back to pressing their own keybinds."""
+        for chord in self.active_chords:
+            chord.keybind.stop()
+        self.active_chords = []
+        self.chords = {}
+        self.chord_partners = {}
+        for button in self.buttons.values():
+            if button.tap_task or button.chord_state == HOLD:
+                button.keybind.stop()
+            button.chord_state = None
+            button.cancel_tasks()
+        self.update_deferred()
+
+    def stop_chord(self, chord: Chord):
+        chord.keybind.stop()
+        if chord in self.active_chords:
+            self.active_chords.remove(chord)
+
+    def update_deferred(self):
+        """Let the controller handle the keybinds of the buttons that are part of a chord.\n\nA held button that becomes part of a chord
+        releases its own keybind first, because releasing a deferred button doesn't stop it. It counts as held for the chords it is in."""
+        partners = self.chord_partners
+        for index, button in self.buttons.items():
+            deferred = index in partners
+            if deferred == button.deferred:
+                continue
+            bit = 1 << index
+            if deferred and button.pressed:
+                button.keybind.stop()
+                button.chord_state = CONSUMED
+                self.chord_mask |= bit
+            elif not deferred:
+                self.chord_mask &= ~bit
+            button.deferred = deferred
+
+    def find_chord(self, bit: int):
+        """Return the biggest chord of held buttons that contains the button of `bit`, or None.\n\nOnly the combinations of held
+        buttons are looked up, so this takes the same time no matter how many chords there are."""
+        others = self.chord_mask & ~bit
+        best = None
+        subset = others
+        while True:
+            chord = self.chords.get(subset | bit)
+            if chord and (best is None or chord.size > best.size):
+                best = chord
+            if subset == 0:
+                return best
+            subset = (subset - 1) & others
+
+    def update_chords(self, button):
+        """Press or release the chords, the tap or the hold of a button that is part of a chord after it changed."""
+        bit = 1 << button.input
+        if button.pressed:
+            if button.tap_task:
+                # Pressed again before the last tap was released
+                button.tap_task.cancel()
+                button.tap_task = None
+                button.keybind.stop()
+            self.chord_mask |= bit
+            chord = self.find_chord(bit)
+            if chord:
+                self.start_chord(chord)
+            elif self.chord_partners.get(button.input, 0) & self.chord_mask:
+                # A partner is held, so wait to see whether the button becomes part of a bigger chord, a tap or a hold
+                button.chord_state = PENDING
+                button.hold_task = self.scheduler.schedule(self.hold_time, lambda: self.start_hold(button))
+            else:
+                # No chord can include this press yet, so the button presses its own keybind right away
+                button.chord_state = HOLD
+                button.keybind.start()
+            return
+        self.chord_mask &= ~bit
+        for chord in [chord for chord in self.active_chords if chord.mask & bit]:
+            self.stop_chord(chord)
+        if button.hold_task:
+            button.hold_task.cancel()
+            button.hold_task = None
+        if button.chord_state == PENDING:
+            # Released before the hold time, so it was a tap. The keys are released after the tap time, not in the same flush
+            button.keybind.start()
+            button.tap_task = self.scheduler.schedule(self.tap_time, lambda: self.end_tap(button))
+        elif button.chord_state == HOLD:
+            button.keybind.stop()
+        button.chord_state = None
+
+    def start_chord(self, chord: Chord):
+        """Press a chord. The smaller chords it contains are released, its pending buttons won't tap or hold, and buttons that
+        pressed their own keybind release it."""
+        for active in [active for active in self.active_chords if active.mask & chord.mask == active.mask]:
+            self.stop_chord(active)
+        for button in chord.buttons:
+            if button.chord_state == HOLD:
+                button.keybind.stop()
+            button.cancel_tasks()
+            button.chord_state = CONSUMED
+        chord.keybind.start()
+        self.active_chords.append(chord)
+
+    def end_tap(self, button):
+        """Release the keybind of a tap. Run by the scheduler."""
+        button.tap_task = None
+        button.keybind.stop()
+
+    def start_hold(self, button):
+        """Press the keybind of a button that was held past the hold time without becoming part of a chord. Run by the scheduler."""
+        button.hold_task = None
+        if button.chord_state == PENDING:
+            button.chord_state = HOLD
+            button.keybind.start()
+
+    def load_keybindings(self, layout_name, filename="keybindings.bin"):
+        """Replace all keybinds with a saved layout. Does nothing if the layout doesn't exist."""
+        profile = self.get_profile(layout_name, filename)
+        if profile:
+            self.switch_profile(profile)
         
-    def load_all_layout_names(self, filename="keybindings.json"):
-        try:
-            with open(filename, "r") as f:
-                all_keybindings = json.load(f)
-            controller_name = self.joystick.get_name()
-            if controller_name in all_keybindings:
-                keybindings = all_keybindings[controller_name]
-                names = list(keybindings.keys())
-                return names
-        except FileNotFoundError:
-            pass
\ No newline at end of file
+    def load_all_layout_names(self, filename="keybindings.bin"):
+        return get_store(filename).layout_names(self.joystick.get_name())
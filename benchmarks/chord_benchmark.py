@@ -0,0 +1,67 @@
+"""Measure how the cost of a controller poll changes with the amount of chords bound.\n\nUsage: `python benchmarks/chord_benchmark.py`
+
+A generated session of a 32 button controller that presses several buttons at a time is replayed once for every amount of chords.
+The benchmark reports polls per second and how many chords were pressed, so the time per poll should stay flat as chords are added."""
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Backends import NullBackend
+from Recording import Recording, ReplayJoystick
+from VirtualController import Controller
+
+BUTTONS = 32
+FRAMES = 20000
+CHORD_COUNTS = (0, 10, 100, 1000)
+KEYS = "abcdefghijklmnopqrstuvwxyz"
+
+def generate():
+    """Generate a session that holds up to four buttons at a time and changes one of them every few frames."""
+    recording = Recording("Chord Benchmark Controller", BUTTONS, 0)
+    rng = random.Random(0)
+    buttons = [0] * BUTTONS
+    for i in range(FRAMES):
+        if i % 3 == 0:
+            held = [b for b in range(BUTTONS) if buttons[b]]
+            if len(held) >= 4 or (held and rng.random() < 0.5):
+                buttons[rng.choice(held)] = 0
+            else:
+                buttons[rng.randrange(BUTTONS)] = 1
+        recording.add_frame(i * 0.001, buttons, [])
+    return recording
+
+def bind_chords(controller: Controller, count: int):
+    """Bind a key to every button and to `count` different chords of two to four buttons."""
+    for i, keybind in enumerate(controller.keybinds()):
+        keybind.bind_key(KEYS[i % len(KEYS)])
+    rng = random.Random(count)
+    chords = set()
+    while len(chords) < count:
+        chords.add(frozenset(f"button {b}" for b in rng.sample(range(BUTTONS), rng.randint(2, 4))))
+    for i, names in enumerate(chords):
+        controller.bind_chord(sorted(names), [KEYS[i % len(KEYS)]])
+
+def measure(recording: Recording, count: int):
+    """Return the polls per second of replaying the recording with `count` chords, and how many times a chord was pressed."""
+    backend = NullBackend()
+    joystick = ReplayJoystick(recording)
+    controller = Controller(backend)
+    controller.set_joystick(joystick)
+    bind_chords(controller, count)
+    pressed = 0
+    start = time.perf_counter()
+    for i in range(len(recording.frames)):
+        joystick.set_frame(i)
+        controller.poll()
+        pressed += len(controller.active_chords)
+    elapsed = time.perf_counter() - start
+    controller.release_all()
+    return len(recording.frames) / elapsed, pressed
+
+if __name__ == "__main__":
+    recording = generate()
+    print(f"{'chords':<10}{'polls/s':>14}{'chord frames':>14}")
+    for count in CHORD_COUNTS:
+        polls, pressed = measure(recording, count)
+        print(f"{count:<10}{polls:>14,.0f}{pressed:>14}")
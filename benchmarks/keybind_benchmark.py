@@ -0,0 +1,64 @@
+"""Measure how many simulated input events per second `Keybind` can queue and flush on a null backend.\n\nUsage: `python benchmarks/keybind_benchmark.py`
+
+The events are counted by the backend, so mouse moves and scrolls, which only send something when they are pressed, count once per
+press. Every case is also run with `UncompiledKeybind`, which classifies the bound keys on every press and release like keybinds did
+before they were compiled into actions, so the comparison can be reproduced."""
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Backends import NullBackend
+from VirtualController import Keybind, MOUSE_BUTTONS, MOVE_DIRECTIONS, SCROLL_DIRECTIONS
+
+# Each case is a list of keys as the GUI binds them
+CASES = {
+    "single key": ["a"],
+    "alt + f4": ["alt", "f4"],
+    "mixed": ["shift", "m_left", "m_move_up", "m_scroll_down"],
+}
+
+class UncompiledKeybind(Keybind):
+    """A keybind that works out what each bound key is every time it is pressed or released, the baseline of the benchmark."""
+    def simulate_input(self):
+        if self.is_pressed == self.keys_down:
+            return
+        self.keys_down = self.is_pressed
+        for key in self.bound_keys:
+            if not key.startswith("m_"):
+                if self.is_pressed:
+                    self.backend.press_key(key)
+                else:
+                    self.backend.release_key(key)
+            elif key in MOUSE_BUTTONS:
+                if self.is_pressed:
+                    self.backend.press_button(MOUSE_BUTTONS[key])
+                else:
+                    self.backend.release_button(MOUSE_BUTTONS[key])
+            else:
+                key = key.replace("m_", "")
+                if key.startswith("move_") and self.is_pressed:
+                    self.backend.move(*MOVE_DIRECTIONS[key.replace("move_", "")])
+                elif key.startswith("scroll_") and self.is_pressed:
+                    self.backend.scroll(*SCROLL_DIRECTIONS[key.replace("scroll_", "")])
+
+def measure(keybind_class, keys, duration: float=1.0):
+    """Return the amount of events per second the backend receives from a keybind with the given keys that is pressed and released."""
+    backend = NullBackend()
+    keybind = keybind_class(backend)
+    for key in keys:
+        keybind.bind_key(key)
+    start = time.perf_counter()
+    end = start + duration
+    while time.perf_counter() < end:
+        for _ in range(1000):
+            keybind.start()
+            keybind.stop()
+            backend.flush()
+    return backend.event_count / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    print(f"{'case':<12}{'uncompiled':>16}{'compiled':>16}{'speedup':>9}  (events/s)")
+    for name, keys in CASES.items():
+        before = measure(UncompiledKeybind, keys)
+        after = measure(Keybind, keys)
+        print(f"{name:<12}{before:>16,.0f}{after:>16,.0f}{after / before:>8.2f}x")
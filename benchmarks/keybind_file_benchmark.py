@@ -0,0 +1,52 @@
+"""Compare loading a large keybindings library from json and from the binary format.\n\nUsage: `python benchmarks/keybind_file_benchmark.py`
+
+For every library size the benchmark saves generated PS4 controller layouts in both formats, then reports the file sizes, the time to
+open each file and read one layout, and the time to read every layout."""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from KeybindStore import KeybindStore
+
+SIZES = (100, 1000, 5000)     # Amounts of layouts, spread over 10 controllers
+BUTTONS = ["x", "circle", "square", "triangle", "share", "ps", "options", "l3", "r3", "l1", "r1", "up", "down", "left", "right", "touchpad", "l2", "r2"]
+KEYS = ["a", "b", "c", "d", "e", "space", "shift", "ctrl_l", "alt", "tab", "m_left", "m_right", "m_scroll_up"]
+
+def generate(count: int):
+    rng = random.Random(count)
+    layouts = {}
+    for i in range(count):
+        keybindings = {button: rng.sample(KEYS, rng.randint(0, 2)) for button in BUTTONS}
+        for stick in ("LeftStick", "RightStick"):
+            keybindings[stick] = {direction: rng.sample(KEYS, rng.randint(0, 1)) for direction in ("up", "down", "left", "right")}
+        layouts.setdefault(f"Controller {i % 10}", {})[f"layout {i}"] = keybindings
+    return layouts
+
+def measure(filename: str):
+    """Return the seconds to open a keybindings file and read one layout, and to read every layout."""
+    store = KeybindStore(filename)
+    start = time.perf_counter()
+    store.get("Controller 0", "layout 0")
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for controller_name in list(store.layouts):
+        for layout_name in store.layout_names(controller_name):
+            store.get(controller_name, layout_name)
+    return first, first + time.perf_counter() - start
+
+if __name__ == "__main__":
+    print(f"{'layouts':<10}{'format':<8}{'size KB':>10}{'open+1 ms':>12}{'all ms':>10}")
+    for count in SIZES:
+        layouts = generate(count)
+        with tempfile.TemporaryDirectory() as directory:
+            for extension in ("json", "bin"):
+                filename = os.path.join(directory, f"keybindings.{extension}")
+                writer = KeybindStore(filename)
+                writer.layouts = layouts
+                writer.dirty = True
+                writer.flush()
+                first, total = measure(filename)
+                print(f"{count:<10}{extension:<8}{os.path.getsize(filename) / 1024:>10.0f}{first * 1000:>12.2f}{total * 1000:>10.2f}")
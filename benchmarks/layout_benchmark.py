@@ -0,0 +1,52 @@
+"""Measure how loading and finding controller layouts scales with the size of the layout library.\n\nUsage: `python benchmarks/layout_benchmark.py`
+
+For every library size the benchmark writes that many generated layout files, then reports the time to compile them from json, the
+time to load them from the cache and the time of a single lookup by GUID and by name."""
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ControllerLayouts import LayoutRegistry
+
+SIZES = (10, 100, 500)
+LOOKUPS = 100000
+
+def write_layouts(directory: str, count: int):
+    """Write `count` layouts that look like a PS4 controller layout."""
+    for i in range(count):
+        inputs = {f"button {b}": ["button", b] for b in range(16)}
+        inputs.update({"LeftStick": ["stick", 0, 1], "RightStick": ["stick", 2, 3], "l2": ["trigger", 4], "r2": ["trigger", 5]})
+        with open(os.path.join(directory, f"layout{i:04}.json"), "w") as f:
+            json.dump({"name": f"Controller {i}", "guids": [f"{i:032x}"], "inputs": inputs}, f)
+
+def measure(count: int):
+    """Return the compile time, cached load time and lookup time in seconds for a library of `count` layouts."""
+    with tempfile.TemporaryDirectory() as directory:
+        write_layouts(directory, count)
+        cache_file = os.path.join(directory, "layouts.cache")
+
+        start = time.perf_counter()
+        LayoutRegistry([directory], cache_file).load()
+        compiled = time.perf_counter() - start
+
+        registry = LayoutRegistry([directory], cache_file)
+        start = time.perf_counter()
+        registry.load()
+        cached = time.perf_counter() - start
+
+        guid = f"{count // 2:032x}"
+        name = f"Controller {count // 2}"
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            registry.get(name, guid)
+            registry.get(name)
+        lookup = (time.perf_counter() - start) / (LOOKUPS * 2)
+    return compiled, cached, lookup
+
+if __name__ == "__main__":
+    print(f"{'layouts':<10}{'compile ms':>12}{'cached ms':>12}{'lookup ns':>12}")
+    for count in SIZES:
+        compiled, cached, lookup = measure(count)
+        print(f"{count:<10}{compiled * 1000:>12.2f}{cached * 1000:>12.2f}{lookup * 1e9:>12.0f}")
@@ -0,0 +1,94 @@
+"""Replay recorded controller sessions through `Controller.poll` against a null backend.\n\nUsage: `python benchmarks/replay_benchmark.py [recording.mist ...]`
+
+Without arguments a set of generated PS4 controller sessions is used. The replay polls the controller every millisecond of the
+recording, and the scheduler, the stick filters and the mouse movement all run on the time of the recording instead of the wall clock,
+so replaying a session always sends the same input. For every session the benchmark reports polls per second, the net amount of memory
+blocks left allocated per poll, the amount of input events sent and how many of them are mapped per second of processing time."""
+import gc
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Backends import NullBackend
+from Recording import Recording, ReplayJoystick
+from Scheduler import Scheduler
+from VirtualController import Controller
+
+FRAMES = 20000
+FRAME_TIME = 0.001
+POLL_TIME = 0.001       # Seconds of the recording between two polls
+KEYS = "abcdefghijklmnopqrstuvwxyz"
+REST_AXES = [0.0, 0.0, 0.0, 0.0, -1.0, -1.0]    # Sticks centred, triggers released
+
+def generate(name: str):
+    """Generate a PS4 controller session."""
+    recording = Recording("PS4 Controller", 16, 6)
+    rng = random.Random(0)
+    buttons = [0] * 16
+    for i in range(FRAMES):
+        axes = list(REST_AXES)
+        match name:
+            case "mashing":
+                if i % 5 == 0:
+                    buttons[rng.randrange(16)] ^= 1
+            case "stick motion":
+                angle = i * 0.01
+                axes[0], axes[1] = math.cos(angle), math.sin(angle)
+                axes[2], axes[3] = math.sin(angle), math.cos(angle)
+            case "turbo":
+                buttons = [1] * 16
+        recording.add_frame(i * FRAME_TIME, buttons, axes)
+    return recording
+
+def bind_everything(controller: Controller, turbo: bool):
+    """Bind a key to every input of the controller."""
+    for i, keybind in enumerate(controller.keybinds()):
+        keybind.bind_key(KEYS[i % len(KEYS)])
+        keybind.while_pressed = turbo
+        keybind.turbo_rate = 60
+
+def measure(recording: Recording, turbo: bool=False):
+    """Return the polls per second, net allocated blocks per poll, sent events and events per second of replaying the recording once."""
+    backend = NullBackend()
+    joystick = ReplayJoystick(recording)
+    scheduler = Scheduler(joystick.clock)
+    controller = Controller(backend, scheduler)
+    controller.set_joystick(joystick)
+    bind_everything(controller, turbo)
+
+    polls = int(recording.duration() / POLL_TIME) + 1
+    gc.collect()
+    gc.disable()
+    blocks = sys.getallocatedblocks()
+    elapsed = 0.0
+    for i in range(polls):
+        joystick.seek(i * POLL_TIME)
+        start = time.perf_counter()
+        scheduler.run_due()
+        controller.poll()
+        controller.move_mouse()
+        backend.flush()
+        elapsed += time.perf_counter() - start
+    blocks = sys.getallocatedblocks() - blocks
+    gc.enable()
+    return polls / elapsed, blocks / polls, backend.event_count, backend.event_count / elapsed
+
+def round_trip(recording: Recording):
+    """Save and load the recording so the benchmark also goes through the file format."""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "session.mist")
+        recording.save(filename)
+        return Recording.load(filename)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sessions = {os.path.basename(filename): (Recording.load(filename), False) for filename in sys.argv[1:]}
+    else:
+        sessions = {name: (round_trip(generate(name)), name == "turbo") for name in ("idle", "mashing", "stick motion", "turbo")}
+    print(f"{'session':<14}{'polls/s':>12}{'blocks/poll':>13}{'events':>9}{'events/s':>12}")
+    for name, (recording, turbo) in sessions.items():
+        polls, blocks, events, events_per_second = measure(recording, turbo)
+        print(f"{name:<14}{polls:>12,.0f}{blocks:>13.3f}{events:>9}{events_per_second:>12,.0f}")
@@ -0,0 +1,27 @@
+"""Report the import time of the entry points and their startup budget.\n\nUsage: `python benchmarks/startup_benchmark.py`
+
+Every module is imported in a fresh interpreter with `-X importtime`, and the fastest of several runs is shown next to its budget and
+the heavy dependencies it imported. tests/test_startup.py checks the budgets of the entry points that must start without them."""
+import os
+import sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+from test_startup import HEAVY, RUNS, import_times
+
+# (module, budget in milliseconds, whether it may import the heavy modules)
+CHECKS = (
+    ("KeybindStore", 50, False),
+    ("VirtualController", 80, False),
+    ("mist_input", 80, False),      # The run, list, record and calibrate commands import pygame when they start
+    ("main", 400, True),            # The GUI needs pygame for the input engine
+)
+
+if __name__ == "__main__":
+    print(f"{'module':<20}{'ms':>8}{'budget':>8}  heavy imports")
+    for module, budget, heavy_allowed in CHECKS:
+        import_times(module)    # Writes the bytecode cache
+        runs = [import_times(module) for _ in range(RUNS)]
+        milliseconds = min(times[module] for times in runs) / 1000
+        heavy = [name for name in HEAVY if name in runs[0]]
+        over = milliseconds > budget or bool(heavy) and not heavy_allowed
+        print(f"{module:<20}{milliseconds:>8.1f}{budget:>8}  {', '.join(heavy) or '-'}{'  OVER BUDGET' if over else ''}")
@@ -1,27 +1,25 @@
+import sys
 import tkinter as tk
-from tkinter import ttk
-import pygame
-from pynput.keyboard import Controller as KeyboardController, Key
-from pynput.mouse import Controller as MouseController
+from tkinter import ttk, messagebox
 import VirtualController
-from KeyConfigWindow import KeyConfigWindow
+from CalibrationWindow import CalibrationWindow
+from InputEngine import InputEngine
+from InputVisualizer import InputVisualizer
+from KeybindList import KeybindList
 
 class ControllerMapperApp:
-    def __init__(self, root):
+    def __init__(self, root, stats: bool=False):
         # Initialize the main application
         self.root = root
         self.root.title("Mist Input")
 
-        # Initialize pygame for controller input handling
-        pygame.init()
-        
-        # Initialize keyboard and mouse controllers
-        self.keyboard = KeyboardController()
-        self.mouse = MouseController()
-        
         self.joystick = None
         self.all_joysticks = []
-        self.controller = VirtualController.Controller()
+        self.controller = None      # The controller of the selected joystick
+        self.engine = InputEngine(stats=stats)    # Owns the controllers. Changes to them are sent to the engine thread. Only initialises the pygame modules it needs
+        self.last_snapshot = None
+        self.devices_changed = 0
+        self.input_visible = True   # Whether the Input tab is shown. The input test is only drawn while it is
         
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill=tk.BOTH, expand=True)
@@ -31,53 +29,77 @@ class ControllerMapperApp:
         self.create_keybind_screen()
         self.create_saved_screen()
         
+        # The engine thread initialises pygame, so it is started before the controllers are listed
+        self.engine.start()
+
         # Check for connected controllers
         self.check_connected_controllers()
         
-        # Refresh rate in milliseconds
-        self.refresh_rate = 10
+        # Refresh rate of the input display in milliseconds, about 30 frames per second. The input itself is mapped by the engine thread
+        self.refresh_rate = 33
         
+        self.root.bind("<Destroy>", self.on_destroy)
         self.poll_controller()
         
+    def on_destroy(self, event):
+        """Stop the input engine when the main window closes."""
+        if event.widget == self.root:
+            self.engine.stop()
+        
     def on_tab_change(self, event):
         """Handle tab change event."""
         selected_tab = event.widget.tab(event.widget.index("current"), "text")
-        if selected_tab == "Saved":
+        self.input_visible = selected_tab == "Input"
+        if selected_tab == "Keybinds":
+            self.keybind_list.refresh()     # Loading a layout changes the keybinds the rows show
+        if selected_tab == "Saved" and self.controller:
             self.notebook.winfo_children()[2].winfo_children()[0].winfo_children()[0].config(values=self.controller.load_all_layout_names())
         
     def check_connected_controllers(self):
-        """Check for connected controllers and display them in the text box."""
-        self.joystick = None
-        self.all_joysticks = []
+        """Check for connected controllers and display them in the text box. Controllers that are mapping keep mapping."""
+        self.devices_changed = self.engine.devices_changed
         self.input_text.config(state=tk.NORMAL)
         self.input_text.delete(1.0, tk.END)
-        if pygame.joystick.get_init():
-            pygame.joystick.quit()
-        pygame.joystick.init()
-        if pygame.joystick.get_count() == 0:
+        self.all_joysticks = self.engine.send(self.engine.get_joysticks).result()
+        if len(self.all_joysticks) == 0:
             self.input_text.insert(tk.END, "No controllers detected.")
         names = []
-        for i in range(pygame.joystick.get_count()):
-            joystick = pygame.joystick.Joystick(i)
-            joystick.init()
+        for joystick in self.all_joysticks:
             names.append(joystick.get_name())
-            self.all_joysticks.append(joystick)
             self.input_text.insert(tk.END, f"Detected controller: {joystick.get_name()}\n")
         self.joystick_picker.config(values=names)
         self.input_text.config(state=tk.DISABLED)
         
     def set_joystick(self, event):
-        """Set the joystick to the selected one."""
+        """Start mapping the selected joystick and show its keybinds. Joysticks that were selected before keep mapping."""
         name = self.joystick_picker.get()
         self.joystick = self.all_joysticks[self.joystick_picker.current()]
-        self.controller.set_joystick(self.joystick)
-        for key, value in self.controller.inputs.items():
-            if hasattr(value, "pressed"):
-                self.create_keybind_row(self.notebook.winfo_children()[1], key, value.keybind)
-            else:
-                for k, v in value.keybind.items():
-                    self.create_keybind_row(self.notebook.winfo_children()[1], f"{key} {k}", v)
+        self.controller = self.engine.send(self.engine.add_joystick, self.joystick).result()
+        self.engine.send(self.controller.load_calibration)
+        self.last_snapshot = None
+        self.visualizer.set_inputs(self.controller.layout.inputs)
+        self.keybind_list.set_controller(self.controller)
+    
+    def stop_mapping(self):
+        """Stop mapping the selected joystick."""
+        if not self.joystick:
+            return
+        self.engine.send(self.engine.remove_joystick, self.controller.joystick.get_instance_id())
+        self.joystick = None
+        self.controller = None
+        self.keybind_list.set_controller(None)
+        self.visualizer.set_inputs(())
+        self.joystick_picker.set("")
     
+    def open_calibration_window(self):
+        """Calibrate the sticks and triggers of the selected controller."""
+        if not self.controller:
+            return
+        window = tk.Toplevel(self.root)
+        window.grab_set()
+        window.transient(self.root)
+        CalibrationWindow(window, self.controller, self.engine)
+
     def create_input_screen(self):
         """Create the input screen for the application."""
         frame = ttk.Frame(self.notebook)
@@ -90,71 +112,36 @@ class ControllerMapperApp:
         self.joystick_picker.bind("<<ComboboxSelected>>", self.set_joystick)
         self.refresh_button = ttk.Button(frame, text="Refresh", command=self.check_connected_controllers)
         self.refresh_button.pack(pady=5)
+        self.stop_button = ttk.Button(frame, text="Stop mapping", command=self.stop_mapping)
+        self.stop_button.pack(pady=5)
+        self.calibrate_button = ttk.Button(frame, text="Calibrate", command=self.open_calibration_window)
+        self.calibrate_button.pack(pady=5)
 
         label = ttk.Label(frame, text="Controller Input Test", font=("Arial", 14))
         label.pack(pady=5)
 
-        self.input_text = tk.Text(frame, height=10, state=tk.DISABLED, wrap=tk.WORD)
+        self.input_text = tk.Text(frame, height=3, state=tk.DISABLED, wrap=tk.WORD)
         self.input_text.pack(fill=tk.BOTH, padx=10, pady=5)
+        self.visualizer = InputVisualizer(frame)
+        self.visualizer.pack(fill=tk.X, padx=10, pady=5)
+        
+        if self.engine.stats_enabled:
+            stats_label = ttk.Label(frame, text="Latency (ms)", font=("Arial", 14))
+            stats_label.pack(pady=5)
+            self.stats_text = ttk.Label(frame, font=("Courier", 10), justify=tk.LEFT)
+            self.stats_text.pack(fill=tk.X, padx=10, pady=5)
+            self.update_stats()
+        
+    def update_stats(self):
+        """Show the latency percentiles of the input engine, once per second."""
+        self.stats_text.config(text=self.engine.report())
+        self.root.after(1000, self.update_stats)
         
     def create_keybind_screen(self):
         """Create the keybind screen for the application."""
         frame = ttk.Frame(self.notebook)
         self.notebook.add(frame, text="Keybinds")
-        
-    def create_keybind_row(self, frame, name, keybind, text=""):
-        row = ttk.Frame(frame)
-        row.pack(fill=tk.X, padx=10, pady=2)
-
-        label = ttk.Label(row, text=name, width=15)
-        label.pack(side=tk.LEFT)
-
-        entry = ttk.Entry(row, width=15, state="readonly", justify="center", text=text)
-        entry.pack(side=tk.LEFT, padx=5)
-    
-        def start_listening():
-            entry.config(state="normal")
-            entry.delete(0, tk.END)
-            entry.insert(0, f"...")
-            entry.config(state="readonly")
-            self.root.bind_all("<KeyPress>", on_key_press)
-
-        def on_key_press(event):
-            key_name = event.keysym
-            keybind.bind_key(key_name)
-            entry.config(state="normal")
-            entry.delete(0, tk.END)
-            entry.insert(0, key_name)
-            entry.config(state="readonly")
-            self.root.unbind_all("<KeyPress>")
-
-        button = ttk.Button(row, text="Bind", command=start_listening)
-        button.pack(side=tk.LEFT, padx=5)
-        
-        def clear_binding():
-            entry.config(state="normal")
-            entry.delete(0, tk.END)
-            entry.config(state="readonly")
-            keybind.clear_key()
-
-        clear_button = ttk.Button(row, text="Clear", command=clear_binding)
-        clear_button.pack(side=tk.LEFT, padx=5)
-        
-        def open_advanced_keybind_window(input):
-            adv_window = tk.Toplevel(self.root)
-            adv_window.grab_set()
-            adv_window.transient(self.root)
-            KeyConfigWindow(adv_window, input, entry)
-        
-        edit_button = ttk.Button(row, text="Edit", command=lambda: open_advanced_keybind_window(keybind))
-        edit_button.pack(side=tk.LEFT, padx=5)
-        
-        while_pressed_var = tk.BooleanVar(value=False)
-        def toggle_while_pressed():
-            keybind.while_pressed = while_pressed_var.get()
-
-        while_pressed_check = ttk.Checkbutton(row, text="Turbo", variable=while_pressed_var, command=toggle_while_pressed)
-        while_pressed_check.pack(side=tk.LEFT, padx=5)
+        self.keybind_list = KeybindList(frame, self)
         
     def create_saved_screen(self):
         """Create the saved keybinds screen for the application."""
@@ -165,46 +152,69 @@ class ControllerMapperApp:
         row.pack(fill=tk.X, padx=10, pady=2)
         all_saved = ttk.Combobox(row, text="All")
         all_saved.pack(side=tk.LEFT, padx=5)
-        save_button = ttk.Button(row, text="Save", command=lambda: self.controller.save_keybindings(all_saved.get()))
+        save_button = ttk.Button(row, text="Save", command=lambda: self.controller and self.engine.send(self.controller.save_keybindings, all_saved.get()))
         save_button.pack(side=tk.LEFT, padx=5)
-        load_button = ttk.Button(row, text="Load", command=lambda: self.controller.load_keybindings(all_saved.get()))
+        load_button = ttk.Button(row, text="Load", command=lambda: self.controller and self.engine.send(self.controller.load_keybindings, all_saved.get()))
         load_button.pack(side=tk.LEFT, padx=5)
         
+        # Holding the buttons together switches to the selected layout, which is compiled ahead of time so switching is instant
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X, padx=10, pady=2)
+        ttk.Label(row, text="Switch with buttons (e.g. l1+r1+triangle):").pack(side=tk.LEFT, padx=5)
+        combo_entry = ttk.Entry(row, width=25)
+        combo_entry.pack(side=tk.LEFT, padx=5)
+        def bind_combo():
+            buttons = [button.strip() for button in combo_entry.get().split("+") if button.strip()]
+            if self.controller and buttons and all_saved.get():
+                try:
+                    self.engine.send(self.controller.bind_profile_combo, buttons, all_saved.get()).result()
+                except ValueError as e:
+                    messagebox.showerror("Invalid button combo", str(e))
+        combo_button = ttk.Button(row, text="Bind", command=bind_combo)
+        combo_button.pack(side=tk.LEFT, padx=5)
+
+        # Holding the buttons together presses the keys instead of the keys of the buttons. Saved with the layout
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X, padx=10, pady=2)
+        ttk.Label(row, text="Chord (e.g. l1+x):").pack(side=tk.LEFT, padx=5)
+        chord_entry = ttk.Entry(row, width=15)
+        chord_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(row, text="Keys or macro:").pack(side=tk.LEFT, padx=5)
+        chord_keys_entry = ttk.Entry(row, width=25)
+        chord_keys_entry.pack(side=tk.LEFT, padx=5)
+        def bind_chord():
+            buttons = [button.strip() for button in chord_entry.get().split("+") if button.strip()]
+            text = chord_keys_entry.get().strip()
+            if not self.controller or not buttons or not text:
+                return
+            # Macros have steps like "tap a", keys are joined like "ctrl+c"
+            keys = text if " " in text or ";" in text else text.split("+")
+            try:
+                if isinstance(keys, str):
+                    VirtualController.compile_macro(keys)
+                for button in buttons:
+                    if not isinstance(self.controller.inputs.get(button), self.controller.Button):
+                        raise ValueError(f"'{button}' is not a button of {self.controller.joystick.get_name()}")
+            except ValueError as e:
+                messagebox.showerror("Invalid chord", str(e))
+                return
+            self.engine.send(self.controller.bind_chord, buttons, keys)
+        chord_button = ttk.Button(row, text="Bind", command=bind_chord)
+        chord_button.pack(side=tk.LEFT, padx=5)
+        
     def poll_controller(self):
-        """Poll the controller for input and send it to the keyboard and mouse."""
-        if self.joystick:
-            pygame.event.pump()
-            output_lines = []
-            
-            # Poll the controller for input
-            self.controller.poll()
-            
-            for button in self.controller.pressed:
-                pass
-                
-            for button in self.controller.released:
-                pass
-                
-            for button in self.controller.held:
-                output_lines.append(f"Button {button} held")
-                
-            # Display the controllers internal button number of the input
-            # for i in range(self.joystick.get_numbuttons()):
-            #     if self.joystick.get_button(i):
-            #         output_lines.append(f"Button {i} pressed")
-            
-            for axis in self.controller.sticks:
-                output_lines.append(f"{axis.name} at position {axis.X:.2f}, {axis.Y:.2f} {axis.direction}")
-            
-            # Display input in the test screen
-            self.input_text.config(state=tk.NORMAL)
-            self.input_text.delete(1.0, tk.END)
-            self.input_text.insert(tk.END, "\n".join(output_lines))
-            self.input_text.config(state=tk.DISABLED)
+        """Display the latest controller snapshot from the input engine."""
+        if self.engine.devices_changed != self.devices_changed:
+            self.check_connected_controllers()
+        # The controller's joystick changes when it reconnects, so the joystick is looked up through the controller
+        snapshot = self.engine.get_snapshot(self.controller.joystick.get_instance_id()) if self.controller and self.input_visible else None
+        if snapshot is not None and snapshot is not self.last_snapshot:
+            self.last_snapshot = snapshot
+            self.visualizer.render(snapshot)
         
         self.root.after(self.refresh_rate, self.poll_controller)
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = ControllerMapperApp(root)
+    app = ControllerMapperApp(root, stats="--stats" in sys.argv)
     root.mainloop()
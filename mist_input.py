@@ -0,0 +1,322 @@
+"""Run Mist Input without the GUI.\n\nUsage: `python -m mist_input run --controller "PS4 Controller" --layout gaming`
+
+Map several controllers at once by repeating `--controller` and `--layout`. Switch layouts from the controller with
+`--switch "l1+r1+triangle=racing"`, which switches to the layout while the buttons are held together.
+
+The input engine, and with it pygame, is only imported by the commands that read a controller, so `export` and `import` start quickly."""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from Backends import create_backend
+from KeybindStore import get_store
+
+class Daemon:
+    """Maps one or more controllers with saved layouts until it receives SIGINT or SIGTERM.\n\nSIGHUP reloads the layouts from the keybindings file.
+    With stats on, SIGUSR1 prints the latency report, which is also printed on exit."""
+    def __init__(self, mappings, filename: str="keybindings.bin", pid_file: str=None, status_file: str=None, backend: str="pynput", stats: bool=False, switches=()):
+        self.mappings = mappings    # (controller name, layout name) pairs. A controller name of None maps any controller
+        self.switches = switches    # (button names, layout name) pairs that switch every mapped controller to a layout
+        self.filename = filename
+        self.pid_file = pid_file
+        self.status_file = status_file
+        from InputEngine import InputEngine
+        self.engine = InputEngine(backend=create_backend(backend), stats=stats)
+        # (device key, layout name, controller) of every mapped joystick. Instance ids change when a joystick reconnects, but the engine
+        # gives it its old controller back, so the controller identifies it. The device key is the (guid, name) of the joystick
+        self.layouts = []
+        self.loaded = {}            # Maps the controllers whose layout is loaded to the instance id their joystick had then
+        self.devices_changed = 0    # The engine's count of joystick connects and disconnects when the layouts were last loaded
+        self.stop_event = threading.Event()
+        self.reload_event = threading.Event()
+        self.report_event = threading.Event()
+        self.started = time.time()
+
+    def run(self):
+        """Start mapping and block until the daemon is stopped. Returns the exit code."""
+        signal.signal(signal.SIGINT, self.on_stop_signal)
+        signal.signal(signal.SIGTERM, self.on_stop_signal)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.on_reload_signal)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.on_report_signal)
+
+        # The engine thread opens the joysticks, because SDL delivers their events on the thread that initialised it
+        self.engine.start()
+        if not self.engine.send(self.map_joysticks).result() or not self.engine.send(self.load_layouts).result():
+            self.engine.stop()
+            self.engine.backend.close()
+            return 1
+
+        self.write_pid_file()
+        self.write_status("running")
+        state = "stopped"
+        try:
+            # The engine thread does the mapping. The main thread only waits for signals and checks the engine is still alive
+            while not self.stop_event.wait(1):
+                if not self.engine.thread.is_alive():
+                    print("The input engine stopped on an error, nothing is mapped any more.", file=sys.stderr)
+                    state = "failed"
+                    break
+                if self.reload_event.is_set():
+                    self.reload_event.clear()
+                    self.reload_layouts()
+                elif self.engine.devices_changed != self.devices_changed:
+                    # A reconnected joystick gets the layout again, in case it was reloaded while the joystick was unplugged
+                    self.reload_layouts(changed_only=True)
+                if self.report_event.is_set():
+                    self.report_event.clear()
+                    self.print_report()
+        finally:
+            self.engine.stop()
+            self.print_report()
+            self.engine.backend.close()
+            self.write_status(state)
+            self.remove_pid_file()
+        return 1 if state == "failed" else 0
+
+    def map_joysticks(self):
+        """Start mapping a joystick for every mapping. Returns whether a joystick was found for all of them."""
+        joysticks = self.engine.get_joysticks()
+        for controller_name, layout_name in self.mappings:
+            joystick = self.find_joystick(joysticks, controller_name)
+            if joystick is None:
+                print(f"Controller '{controller_name or 'any'}' is not connected.", file=sys.stderr)
+                return False
+            controller = self.engine.add_joystick(joystick)
+            self.layouts.append(((joystick.get_guid(), joystick.get_name()), layout_name, controller))
+        return True
+
+    def find_joystick(self, joysticks, controller_name: str):
+        """Return the first joystick that isn't mapped yet with the given name, or with any name if the name is None."""
+        for joystick in joysticks:
+            if self.engine.get_controller(joystick.get_instance_id()):
+                continue
+            if not controller_name or joystick.get_name() == controller_name:
+                return joystick
+
+    def find_instance_id(self, controller):
+        """Return the instance id of the joystick a controller maps, or None while the joystick is disconnected."""
+        for instance_id, mapped in list(self.engine.controllers.items()):
+            if mapped is controller:
+                return instance_id
+
+    def reload_layouts(self, changed_only: bool=False):
+        """Load the layouts on the engine thread. When that fails the error is reported and the keybinds that are loaded stay in use."""
+        try:
+            loaded = self.engine.send(self.load_layouts, changed_only).result()
+        except Exception as e:
+            print(f"Error reloading the layouts: {e}", file=sys.stderr)
+            loaded = False
+        if not loaded:
+            print(f"Reloading the layouts from {self.filename} failed, the layouts that loaded before are still used.", file=sys.stderr)
+        self.write_status("running")
+
+    def load_layouts(self, changed_only: bool=False):
+        """Load the layout of every mapped controller that is connected. Returns whether all layouts, and the buttons and layouts of every switch, exist.\n\n
+        With `changed_only` only the controllers whose joystick reconnected since their layout was loaded are loaded."""
+        self.devices_changed = self.engine.devices_changed
+        for device_key, layout_name, controller in self.layouts:
+            instance_id = self.find_instance_id(controller)
+            if instance_id is None:
+                # The joystick is disconnected, its layout is loaded when it reconnects
+                continue
+            if changed_only and self.loaded.get(controller) == instance_id:
+                continue
+            if layout_name not in (controller.load_all_layout_names(self.filename) or []):
+                print(f"No layout '{layout_name}' saved for '{controller.joystick.get_name()}' in {self.filename}.", file=sys.stderr)
+                return False
+            controller.load_calibration(self.filename)
+            # Every saved layout is compiled up front, so switching layouts with a button combo never compiles anything
+            controller.preload_profiles(self.filename)
+            controller.load_keybindings(layout_name, self.filename)
+            controller.profile_combos = {}
+            for buttons, switch_layout in self.switches:
+                try:
+                    controller.bind_profile_combo(buttons, switch_layout, self.filename)
+                except ValueError as e:
+                    print(f"Invalid --switch '{'+'.join(buttons)}={switch_layout}': {e}.", file=sys.stderr)
+                    return False
+            self.loaded[controller] = instance_id
+        return True
+
+    def on_stop_signal(self, signum, frame):
+        self.stop_event.set()
+
+    def on_reload_signal(self, signum, frame):
+        self.reload_event.set()
+
+    def on_report_signal(self, signum, frame):
+        self.report_event.set()
+
+    def print_report(self):
+        if self.engine.stats_enabled:
+            print(self.engine.report(), flush=True)
+
+    def write_pid_file(self):
+        if not self.pid_file:
+            return
+        with open(self.pid_file, "w") as f:
+            f.write(f"{os.getpid()}\n")
+
+    def remove_pid_file(self):
+        if self.pid_file and os.path.exists(self.pid_file):
+            os.remove(self.pid_file)
+
+    def write_status(self, state: str):
+        """Write the daemon's state to the status file as json."""
+        if not self.status_file:
+            return
+        controllers = []
+        for (guid, name), layout_name, controller in self.layouts:
+            # The instance id is None while the joystick is disconnected
+            controllers.append({"instance_id": self.find_instance_id(controller), "name": name, "guid": guid, "layout": layout_name})
+        status = {
+            "state": state,
+            "pid": os.getpid(),
+            "controllers": controllers,
+            "started": self.started,
+            "updated": time.time(),
+        }
+        with open(self.status_file, "w") as f:
+            json.dump(status, f)
+
+def list_controllers(filename: str):
+    """Print every connected controller and the layouts saved for it."""
+    from InputEngine import InputEngine
+    engine = InputEngine()
+    joysticks = engine.get_joysticks()
+    if len(joysticks) == 0:
+        print("No controllers detected.")
+    for joystick in joysticks:
+        controller = engine.add_joystick(joystick)
+        layouts = controller.load_all_layout_names(filename) or []
+        print(f"{joystick.get_name()}: {', '.join(layouts) if layouts else 'no saved layouts'}")
+
+def record(controller_name: str, filename: str, seconds: float):
+    """Record the raw input of a controller to a file until the time is up or the process is interrupted."""
+    import pygame
+    from InputEngine import InputEngine
+    from Recording import Recorder
+    engine = InputEngine()
+    joystick = next((joystick for joystick in engine.get_joysticks() if not controller_name or joystick.get_name() == controller_name), None)
+    if joystick is None:
+        print(f"Controller '{controller_name or 'any'}' is not connected.", file=sys.stderr)
+        return 1
+    pygame.display.init()   # Pygame only delivers joystick events once the display module is initialised
+    recorder = Recorder(joystick)
+    recorder.capture()
+    end = time.monotonic() + seconds
+    print(f"Recording {joystick.get_name()} for {seconds:g} seconds.")
+    try:
+        while time.monotonic() < end:
+            pygame.event.wait(100)
+            pygame.event.clear()
+            recorder.capture()
+    except KeyboardInterrupt:
+        pass
+    recorder.recording.save(filename)
+    print(f"Saved {len(recorder.recording.frames)} frames to {filename}.")
+    return 0
+
+def calibrate(controller_name: str, filename: str, seconds: float):
+    """Measure the centre, range and deadzone of the sticks and triggers of a controller and save them for its GUID."""
+    import pygame
+    from Calibration import Calibrator
+    from InputEngine import InputEngine
+    engine = InputEngine()
+    joystick = next((joystick for joystick in engine.get_joysticks() if not controller_name or joystick.get_name() == controller_name), None)
+    if joystick is None:
+        print(f"Controller '{controller_name or 'any'}' is not connected.", file=sys.stderr)
+        return 1
+    pygame.display.init()   # Pygame only updates the joystick state once the display module is initialised
+    controller = engine.add_joystick(joystick)
+    calibrator = Calibrator(joystick, controller.layout)
+    def sample(method, seconds: float):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            pygame.event.pump()
+            method()
+            time.sleep(0.01)
+    input(f"Let go of the sticks and triggers of {joystick.get_name()} and press Enter.")
+    sample(calibrator.sample_rest, 1)
+    input(f"Press Enter, then move the sticks around their edges and pull the triggers all the way for {seconds:g} seconds.")
+    sample(calibrator.sample_range, seconds)
+    try:
+        calibration = calibrator.result()
+    except ValueError as e:
+        print(f"Calibration failed: {e}.", file=sys.stderr)
+        return 1
+    controller.save_calibration(calibration, filename)
+    for name, deadzone in calibration.deadzones.items():
+        print(f"{name}: deadzone {deadzone:.3f}")
+    print(f"Saved the calibration of {joystick.get_name()} to {filename}.")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mist_input", description="Map controller input to keyboard and mouse input without the GUI.")
+    parser.add_argument("--keybindings", default="keybindings.bin", help="the file the layouts are saved in. Files that end in .json are saved as json")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="map one or more controllers with saved layouts")
+    run_parser.add_argument("--controller", action="append", help="name of a controller to map. Repeat to map several controllers. Defaults to the first connected controller")
+    run_parser.add_argument("--layout", action="append", required=True, help="name of the saved layout to load, once per --controller or once for all of them")
+    run_parser.add_argument("--pid-file", help="write the process id to this file while running")
+    run_parser.add_argument("--status-file", help="write the daemon's state to this file as json")
+    run_parser.add_argument("--stats", action="store_true", help="measure the latency from controller event to injected input and print it on exit or SIGUSR1")
+    run_parser.add_argument("--switch", action="append", default=[], metavar="BUTTONS=LAYOUT", help="switch to a saved layout while the buttons are held together, e.g. \"l1+r1+triangle=racing\". Can be repeated")
+    run_parser.add_argument("--backend", choices=["pynput", "uinput", "null"], default="pynput", help="how simulated input is sent to the system. uinput needs write access to /dev/uinput")
+
+    commands.add_parser("list", help="list connected controllers and their saved layouts")
+
+    record_parser = commands.add_parser("record", help="record the raw input of a controller for replaying in benchmarks")
+    record_parser.add_argument("--controller", help="name of the controller to record. Defaults to the first connected controller")
+    record_parser.add_argument("--output", required=True, help="the file to save the recording to")
+    record_parser.add_argument("--seconds", type=float, default=60, help="how long to record for")
+
+    calibrate_parser = commands.add_parser("calibrate", help="measure the centre and range of the sticks and triggers of a controller")
+    calibrate_parser.add_argument("--controller", help="name of the controller to calibrate. Defaults to the first connected controller")
+    calibrate_parser.add_argument("--seconds", type=float, default=5, help="how long to sample the sticks and triggers at their extremes")
+
+    export_parser = commands.add_parser("export", help="write every saved layout to a json file")
+    export_parser.add_argument("--output", required=True, help="the json file to write")
+
+    import_parser = commands.add_parser("import", help="add the layouts of a json file, replacing saved layouts with the same names")
+    import_parser.add_argument("--input", required=True, help="the json file to read")
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case "run":
+            controllers = args.controller or [None] * len(args.layout)
+            layouts = args.layout * len(controllers) if len(args.layout) == 1 else args.layout
+            if len(controllers) != len(layouts):
+                parser.error("give one --layout for every --controller, or a single --layout for all of them")
+            switches = []
+            for switch in args.switch:
+                buttons, _, layout_name = switch.rpartition("=")
+                if not buttons or not layout_name:
+                    parser.error(f"--switch '{switch}' must look like BUTTONS=LAYOUT, e.g. \"l1+r1+triangle=racing\"")
+                switches.append((buttons.split("+"), layout_name))
+            daemon = Daemon(list(zip(controllers, layouts)), args.keybindings, args.pid_file, args.status_file, args.backend, args.stats, switches)
+            return daemon.run()
+        case "list":
+            list_controllers(args.keybindings)
+            return 0
+        case "record":
+            return record(args.controller, args.output, args.seconds)
+        case "calibrate":
+            return calibrate(args.controller, args.keybindings, args.seconds)
+        case "export":
+            get_store(args.keybindings).export_json(args.output)
+            return 0
+        case "import":
+            store = get_store(args.keybindings)
+            store.import_json(args.input)
+            store.flush()
+            return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Connecting and disconnecting a joystick while the input engine is idle.\n\nRun with `python -m pytest tests`."""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pygame
+from Backends import NullBackend
+from InputEngine import InputEngine
+from KeybindStore import get_store
+from Recording import Recording, ReplayJoystick
+from mist_input import Daemon
+
+def wait_for(condition, timeout: float=2):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+class HotplugTest(unittest.TestCase):
+    def setUp(self):
+        self.recording = Recording("Replay Pad", 16, 4, guid="0300replay")
+        self.recording.add_frame(0, [0] * 16, [0.0] * 4)
+        self.devices = {}       # Maps device indices to the replay joystick pygame would open for them
+        patcher = mock.patch.object(pygame.joystick, "Joystick", lambda device_index: self.devices[device_index])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = InputEngine(backend=NullBackend())
+        self.engine.start()
+        self.addCleanup(self.engine.stop)
+
+    def plug(self, instance_id: int):
+        """Post the event of a replay joystick being connected and return the joystick."""
+        joystick = ReplayJoystick(self.recording, instance_id)
+        self.devices[0] = joystick
+        pygame.event.post(pygame.event.Event(pygame.JOYDEVICEADDED, device_index=0))
+        return joystick
+
+    def idle(self):
+        """Wait until the engine blocks on an empty event queue."""
+        time.sleep(self.engine.idle_timeout / 1000 * 2)
+
+    def test_connect_wakes_idle_engine(self):
+        self.idle()
+        joystick = self.plug(100)
+        self.assertTrue(wait_for(lambda: 100 in self.engine.joysticks))
+        self.assertIs(self.engine.joysticks[100], joystick)
+        self.assertEqual(self.engine.devices_changed, 1)
+
+    def test_disconnect_and_reconnect_restore_controller(self):
+        joystick = self.plug(100)
+        self.assertTrue(wait_for(lambda: 100 in self.engine.joysticks))
+        controller = self.engine.send(self.engine.add_joystick, joystick).result(timeout=2)
+        self.idle()
+        pygame.event.post(pygame.event.Event(pygame.JOYDEVICEREMOVED, instance_id=100))
+        self.assertTrue(wait_for(lambda: self.engine.devices_changed == 2))
+        self.assertNotIn(100, self.engine.controllers)
+        self.assertEqual([entry[2] for entry in self.engine.disconnected], [controller])
+        self.idle()
+        reconnected = self.plug(101)
+        self.assertTrue(wait_for(lambda: 101 in self.engine.controllers))
+        self.assertIs(self.engine.controllers[101], controller)
+        self.assertIs(controller.joystick, reconnected)
+        self.assertEqual(self.engine.disconnected, [])
+
+    def test_reload_after_disconnect_and_reconnect(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, "keybindings.json")
+        status_file = os.path.join(directory.name, "status.json")
+        self.addCleanup(get_store(filename).flush)
+        daemon = Daemon([("Replay Pad", "base")], filename, status_file=status_file, backend="null")
+        daemon.engine = self.engine
+        self.plug(100)
+        self.assertTrue(wait_for(lambda: 100 in self.engine.joysticks))
+        self.assertTrue(self.engine.send(daemon.map_joysticks).result(timeout=2))
+        controller = self.engine.controllers[100]
+        name, _, keybind = next(controller.named_keybinds())
+        get_store(filename).put("Replay Pad", "base", {name: ["a"]})
+        self.assertTrue(self.engine.send(daemon.load_layouts).result(timeout=2))
+        self.assertEqual(list(keybind.bound_keys), ["a"])
+
+        # Reloading while the joystick is unplugged skips it
+        pygame.event.post(pygame.event.Event(pygame.JOYDEVICEREMOVED, instance_id=100))
+        self.assertTrue(wait_for(lambda: 100 not in self.engine.controllers))
+        get_store(filename).put("Replay Pad", "base", {name: ["b"]})
+        daemon.reload_layouts()
+        with open(status_file) as f:
+            self.assertEqual(json.load(f)["controllers"][0]["instance_id"], None)
+        self.assertEqual(list(keybind.bound_keys), ["a"])
+
+        # The reconnected joystick gets the reloaded layout, and later reloads find it by its new instance id
+        self.plug(101)
+        self.assertTrue(wait_for(lambda: 101 in self.engine.controllers))
+        self.assertNotEqual(self.engine.devices_changed, daemon.devices_changed)
+        daemon.reload_layouts(changed_only=True)
+        self.assertEqual(list(keybind.bound_keys), ["b"])
+        get_store(filename).put("Replay Pad", "base", {name: ["c"]})
+        daemon.reload_layouts()
+        self.assertEqual(list(keybind.bound_keys), ["c"])
+        with open(status_file) as f:
+            self.assertEqual(json.load(f)["controllers"][0]["instance_id"], 101)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""Check the import time of the headless entry points against their startup budget.\n\nRun with `python -m pytest tests`.
+`python benchmarks/startup_benchmark.py` reports the import times of every entry point."""
+import os
+import subprocess
+import sys
+import unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNS = 5
+HEAVY = ("pygame", "pynput")    # Imported on first use, never at startup
+
+def import_times(module: str):
+    """Import a module in a fresh interpreter with `-X importtime` and return the cumulative import time of every module it imported, in microseconds."""
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)    # Measure a start with cached bytecode, like an installed program
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+class StartupTest(unittest.TestCase):
+    def assert_starts_within(self, module: str, budget: float):
+        """Assert the fastest of several imports of a module takes at most `budget` milliseconds and doesn't import pygame or pynput."""
+        import_times(module)    # Writes the bytecode cache
+        runs = [import_times(module) for _ in range(RUNS)]
+        self.assertEqual([name for name in HEAVY if name in runs[0]], [], f"{module} imports a heavy module at startup")
+        milliseconds = min(times[module] for times in runs) / 1000
+        self.assertLessEqual(milliseconds, budget, f"importing {module} took {milliseconds:.1f} ms")
+
+    def test_virtual_controller(self):
+        self.assert_starts_within("VirtualController", 80)
+
+    def test_mist_input(self):
+        # The run, list, record and calibrate commands import pygame when they start, not the module
+        self.assert_starts_within("mist_input", 80)
+
+if __name__ == "__main__":
+    unittest.main()